@@ -1,247 +1,449 @@
-import csv
+import time
+startup_started = time.perf_counter()  # Startup time is reported once the window is built
+
 import tkinter as tk
 from tkinter import ttk  # For Combobox and Notebook
-import random
-from typing import List, Dict, Tuple  # Import Tuple
 from tkinter.font import Font  # Import the Font class
 import os
-
-def get_songs_by_categories(csv_file, selected_categories: List[str], key_mode_filter: str,
-                           include_nm_hd_mx: bool, include_sc: bool,
-                           nm_hd_mx_min_level: int, nm_hd_mx_max_level: int,
-                           sc_min_level: int, sc_max_level: int) -> List[Tuple[str, str, str, str]]:
+import random
+from randomizer_core import (SONG_LIST_FILE, CATEGORY_NAMES_FILE, KEY_MODES, DIFFICULTIES, ChartFilter, Fairness,
+                             set_chart_index, read_song_list, load_full_category_names, parse_category_weights,
+                             format_stars, format_history_entry, file_signature, REPEAT_ATTEMPTS,
+                             DIFFICULTY_COLORS)
+from randomizer_history import HistoryStore, load_recent_draws
+from randomizer_cache import load_song_database, write_cache, default_cache_file
+from randomizer_metrics import METRICS, profile_call
+from randomizer_history_view import HistoryView
+from randomizer_io import IOWorker
+from randomizer_stats import load_history_stats
+
+def current_filter() -> ChartFilter:
     """
-    Reads a CSV file and returns a list of song titles with their corresponding difficulty and level,
-    filtered by multiple categories, key mode, and separate level ranges for NM/HD/MX and SC.
-
-    Args:
-        csv_file (str): The path to the CSV file.
-        selected_categories (List[str]): A list of categories to filter by.
-                                         If "All" is in the list, no filter is applied.
-        key_mode_filter (str): The key mode to filter by (e.g., "4B", "5B", "6B", "8B").
-                               If "All" or "" no filter applied.
-        include_nm_hd_mx (bool): Include NM, HD, and MX difficulties.
-        include_sc (bool): Include SC difficulty.
-        nm_hd_mx_min_level (int): The minimum level for NM, HD, and MX difficulties.
-        nm_hd_mx_max_level (int): The maximum level for NM, HD, and MX difficulties.
-        sc_min_level (int): The minimum level for SC difficulty.
-        sc_max_level (int): The maximum level for SC difficulty.
+    Reads the current category, key mode, difficulty and level selections from the GUI.
 
     Returns:
-        List[Tuple[str, str, str, str]]: A list of tuples, where each tuple contains the song title,
-                                     the difficulty (e.g., "4B - NM"), the level, and the category.
+        ChartFilter: The selected filter criteria.
     """
+    # Correct way to get selected categories:
+    selected_categories = [category['short_name'] for category in category_buttons if category['variable'].get() == 1]
+    key_modes = [key_mode for key_mode in KEY_MODES if key_mode_vars[key_mode].get()]
+    if len(key_modes) == len(KEY_MODES):
+        key_mode_filter = "All"
+    else:
+        key_mode_filter = ",".join(key_modes) or "None"  # No key mode ticked matches nothing
+    # Every ticked difficulty with its own level range
+    difficulty_levels = tuple((diff, difficulty_rows[diff]['min_var'].get(), difficulty_rows[diff]['max_var'].get())
+                              for diff in DIFFICULTIES if difficulty_rows[diff]['toggle_var'].get())
+    return ChartFilter(tuple(selected_categories), key_mode_filter, False, False, 0, 0, 0, 0, difficulty_levels)
 
-    try:
-        with open(csv_file, 'r', encoding='utf-8') as file:
-            reader = csv.reader(file)
-            header = next(reader)  # Skip header row
-            song_data = []
-            for row in reader:
-                title = row[0]
-                category = row[1]
-                if "All" in selected_categories or category in selected_categories:
-                    # Apply key mode and difficulty filters
-                    if key_mode_filter and key_mode_filter != "All" and key_mode_filter:
-                        if include_nm_hd_mx:
-                            for diff in ["NM", "HD", "MX"]:
-                                level_str = row[header.index(f"{key_mode_filter} {diff}")]
-                                if level_str != '0' and level_str.isdigit():  # Ensure level is a number
-                                    level = int(level_str)
-                                    if nm_hd_mx_min_level <= level <= nm_hd_mx_max_level:
-                                        song_data.append((title, f"{key_mode_filter} {diff}", level_str, category)) # added category
-                        if include_sc:
-                            level_str = row[header.index(f"{key_mode_filter} SC")]
-                            if level_str != '0' and level_str.isdigit():
-                                level = int(level_str)
-                                if sc_min_level <= level <= sc_max_level:
-                                    song_data.append((title, f"{key_mode_filter} SC", level_str, category)) # added category
-
-                    elif not key_mode_filter or key_mode_filter == "All" or not key_mode_filter:
-                         if include_nm_hd_mx:
-                            for diff in ["NM", "HD", "MX"]:
-                                key = f"{row[2][:2]} {diff}"
-                                if key in header:
-                                    level_str = row[header.index(key)]
-                                    if level_str != '0' and level_str.isdigit():
-                                        level = int(level_str)
-                                        if nm_hd_mx_min_level <= level <= nm_hd_mx_max_level:
-                                            song_data.append((title, f"{row[2][:2]} {diff}", level_str, category)) # added category
-                         if include_sc:
-                            key = f"{row[2][:2]} SC"
-                            if key in header:
-                                level_str = row[header.index(key)]
-                                if level_str != '0' and level_str.isdigit():
-                                    level = int(level_str)
-                                    if sc_min_level <= level <= sc_max_level:
-                                        song_data.append((title, f"{row[2][:2]} SC", level_str, category)) # added category
-            return song_data
-    except FileNotFoundError:
-        return [("Error: CSV file not found.", "", "", "")]
-    except Exception as e:
-        return [(f"An error occurred: {e}", "", "", "")]
-
-
-
-def load_full_category_names(category_file):
+def current_fairness() -> Fairness:
     """
-    Loads the mapping of short category names to full category names from a CSV.
-
-    Args:
-        category_file (str): Path to the CSV file containing category mappings.
+    Reads the selected sampling fairness (and custom category weights) from the GUI.
 
     Returns:
-        Dict[str, str]: A dictionary where keys are short names and values are full names.
-    """
-
-    full_category_names = {}
-    try:
-        with open(category_file, 'r', encoding='utf-8') as file:
-            reader = csv.reader(file)
-            next(reader)  # Skip header
-            for row in reader:
-                full_category_names[row[0]] = {
-                    'full_name': row[1],
-                    'source': row[2]
-                }
-        full_category_names["All"] = {'full_name': "All Categories", 'source': "All"}  # added this line
-    except FileNotFoundError:
-        print(f"Error: Category file '{category_file}' not found.")
-    except Exception as e:
-        print(f"An error occurred while loading categories: {e}")
-    return full_category_names
+        Fairness: The selected fairness.
 
-def save_to_history(song_data: Tuple[str, str, str, str]):
+    Raises:
+        ValueError: If the custom category weights cannot be parsed.
     """
-    Saves the selected song to the history file.
+    mode = fairness_choices[fairness_var.get()]
+    if mode == "custom":
+        return Fairness(mode, parse_category_weights(category_weights_var.get()))
+    return Fairness(mode)
 
-    Args:
-        song_data (Tuple[str, str, str, str]): A tuple containing the song title, difficulty, level, and category.
+def update_pool_counter():
+    """
+    Shows how many charts and songs match the current filters, straight from the chart index buckets.
     """
+    global pool_update_id
+    pool_update_id = None
+    if song_database is None:
+        return
     try:
-        with open("history.txt", "a", encoding="utf-8") as file:
-            file.write(f"{song_data[0]},{song_data[1]},{song_data[2]}, {song_data[3]}\n") # added category to history
-    except Exception as e:
-        print(f"An error occurred while saving to history: {e}")
+        chart_filter = current_filter()
+    except tk.TclError:
+        pool_label.config(text="Matching: -", fg="gray")  # A level spinbox is being edited
+        return
+    index = song_database.index
+    charts = index.count(chart_filter)
+    songs = index.count_songs(chart_filter) if charts else 0
+    pool_label.config(text=f"Matching: {charts} charts from {songs} songs", fg="white" if charts else "red")
+
+def schedule_pool_update(*args):
+    """Updates the matching pool counter once the filters stop changing for a moment."""
+    global pool_update_id
+    if pool_update_id is not None:
+        window.after_cancel(pool_update_id)
+    pool_update_id = window.after(POOL_UPDATE_DELAY_MS, update_pool_counter)
+
+def read_source_signatures():
+    """Runs on the I/O worker: returns the signatures of SongList.csv and CategoryNames.csv."""
+    return file_signature(SONG_LIST_FILE), file_signature(CATEGORY_NAMES_FILE)
+
+def check_source_files():
+    """
+    Polls SongList.csv and CategoryNames.csv and reloads them once a change has settled, so a file
+    that is still being written is not read. The files are stat'ed on the I/O worker, as that can
+    block on network-synced disks; compare_source_files handles the result.
+    """
+    io_worker.submit(read_source_signatures, callback=compare_source_files,
+                     error_callback=lambda e: window.after(SOURCE_POLL_MS, check_source_files))
 
-def load_history():
+def compare_source_files(signatures):
+    """Reloads the source files if their signatures are unchanged since the last poll, then polls again."""
+    global pending_signatures
+    try:
+        if signatures != source_signatures:
+            if signatures == pending_signatures:
+                reload_source_files(signatures)
+            pending_signatures = signatures
+    finally:
+        window.after(SOURCE_POLL_MS, check_source_files)
+
+def reload_source_files(signatures):
+    """
+    Reads the updated song list and category names on the I/O worker; apply_source_files applies them.
     """
-    Loads the song history from the history file.
+    global source_signatures, reload_started
+    source_signatures = signatures
+    reload_started = time.perf_counter()
+    io_worker.submit(read_source_files, song_database is None, callback=apply_source_files,
+                     error_callback=lambda e: startup_label.config(text=f"Could not reload the song list: {e}"))
 
-    Returns:
-        List[Tuple[str, str, str, str]]: A list of tuples, where each tuple contains the song title,
-                                     difficulty, and level.
+def read_source_files(full_load):
+    """
+    Runs on the I/O worker: reads the whole song database if none is loaded yet, otherwise the song
+    list rows, and the category names. The index's song table is built here too, so that
+    apply_song_list only has to diff the songs and splice the changed buckets on the Tk thread.
+    """
+    if full_load:
+        database = load_song_database(SONG_LIST_FILE, CATEGORY_NAMES_FILE)
+        database.index.song_table()
+        return database, None, database.full_category_names
+    song_database.index.song_table()  # Only walks the charts the first time and after a full rebuild
+    return None, read_song_list(SONG_LIST_FILE), load_full_category_names(CATEGORY_NAMES_FILE)
+
+def apply_source_files(result):
     """
-    history_data = []
+    Applies an updated song list to the chart index (only the added, removed and changed songs)
+    and rebuilds the category buttons if the categories changed, keeping the selection.
+    """
+    global song_database, full_category_names, unique_categories
+    database, songs, new_category_names = result
     try:
-        with open("history.txt", "r", encoding="utf-8") as file:
-            for line in file:
-                song_data = line.strip().split(",")
-                if len(song_data) == 4:
-                    history_data.append(tuple(song_data))
-    except FileNotFoundError:
-        print("History file not found.  Creating a new one.")
+        if database is not None:
+            song_database = database
+            changes_text = f"{len(song_database.index)} charts loaded"
+        else:
+            changes = song_database.index.apply_song_list(songs)
+            set_chart_index(SONG_LIST_FILE, song_database.index)
+            changes_text = f"{changes.added} songs added, {changes.changed} changed, {changes.removed} removed"
     except Exception as e:
-        print(f"An error occurred while loading history: {e}")
-    return history_data
-
-# Define difficulty colors
-difficulty_colors = {
-    "SC": "#ff00ff",
-    "MX": "#ff0000",
-    "HD": "#ff8200",
-    "NM": "#ffd966"
-}
+        startup_label.config(text=f"Could not reload the song list: {e}")
+        return
+    index = song_database.index
+    if new_category_names != full_category_names or len(unique_categories) != len(index.category_names) + 1:
+        full_category_names = new_category_names
+        unique_categories = sorted(["All"] + index.category_names)
+        build_category_buttons()
+    # So that the next start loads the new list from the cache. The index is only changed again after
+    # the next read, which the worker runs after this write.
+    io_worker.submit(write_cache, default_cache_file(SONG_LIST_FILE), SONG_LIST_FILE, CATEGORY_NAMES_FILE, index,
+                     full_category_names, error_callback=lambda e: print(f"Could not write the song cache: {e}"))
+    schedule_pool_update()
+    startup_label.config(text=f"Song list reloaded: {changes_text} "
+                              f"({(time.perf_counter() - reload_started) * 1000:.0f} ms)")
+
+def current_index():
+    """
+    Returns the chart index the GUI draws from. apply_source_files keeps it up to date when the CSVs
+    change, so the Tk thread never has to parse the song list again.
+    """
+    if song_database is None:
+        raise FileNotFoundError(SONG_LIST_FILE)
+    return song_database.index
 
 def display_song():
     """
     Gets a random song title with difficulty and level based on the selected criteria and displays it.
-    Also saves the selected song to the history file.
+    Also saves the selected song to the history.
     """
-    # Correct way to get selected categories:
-    selected_categories = [category['short_name'] for category in category_buttons if category['variable'].get() == 1]
-    selected_key_mode = key_mode_var.get()
-    include_nm_hd_mx_value = nm_hd_mx_toggle_var.get()  # Get the state of the NM/HD/MX toggle
-    include_sc_value = sc_toggle_var.get()  # Get the state of the SC toggle
-
-    nm_hd_mx_min_level_value = nm_hd_mx_min_level_var.get()
-    nm_hd_mx_max_level_value = nm_hd_mx_max_level_var.get()
-    sc_min_level_value = sc_min_level_var.get()
-    sc_max_level_value = sc_max_level_var.get()
-
-    songs = get_songs_by_categories('SongList.csv', selected_categories, selected_key_mode,
-                                     include_nm_hd_mx_value, include_sc_value,
-                                     nm_hd_mx_min_level_value, nm_hd_mx_max_level_value,
-                                     sc_min_level_value, sc_max_level_value)  # Replace with your CSV file name
-    if songs:
-        song, difficulty, level, category = random.choice(songs) # added category
+    chart_filter = current_filter()
+
+    chart, error_text = None, None
+    try:
+        index = current_index()
+        # Picks through the alias table of the current filter without building the candidate list
+        with METRICS.stage("draw"):
+            chart = index.draw(chart_filter, recent=recent_draws, fairness=current_fairness())
+    except FileNotFoundError:
+        error_text = "Error: CSV file not found."
+    except Exception as e:
+        error_text = f"An error occurred: {e}"
+    if chart is not None:
+        song, difficulty, level, category = index.chart_tuple(chart) # added category
         # Get the full category name
         full_category_name = full_category_names.get(category, {'full_name': category}).get('full_name')
         display_text = f"{full_category_name}\n{song} ({difficulty})\n"  # Include full category name
 
-        color = "white"  # Default color
-        if selected_key_mode != "All" and selected_key_mode and difficulty and level:
-            diff_short = difficulty.split()[-1]  # Get "NM", "HD", "MX", or "SC"
-            color = difficulty_colors.get(diff_short, "white")  # Get color, default to white if not found.
-            if "NM" in difficulty or "HD" in difficulty or "MX" in difficulty:
-                stars = "☆" * int(level)
-            elif "SC" in difficulty:
-                stars = "★" * int(level)
-            else:
-                stars = "N/A"
-            # Add spaces every 5 stars
-            stars = " ".join([stars[i:i+5] for i in range(0, len(stars), 5)])
-            display_text += stars
-        else:
-            display_text = f"{full_category_name}\n{song}\n" # show category even if not detailed.
+        diff_short = difficulty.split()[-1]  # Get "NM", "HD", "MX", or "SC"
+        color = DIFFICULTY_COLORS.get(diff_short, "white")  # Get color, default to white if not found.
+        display_text += format_stars(difficulty, level)
 
-        song_label.config(text=display_text, font=title_font, fg=color,  # Apply the title font
-                         bg="black", highlightthickness=1, highlightcolor="white", justify=tk.CENTER)  # Set black background and center text
-        save_to_history((song, difficulty, level, category))  # Save to history # added category
-        update_history_display() # Update the history tab
+        with METRICS.stage("render"):
+            song_label.config(text=display_text, font=title_font, fg=color,  # Apply the title font
+                             bg="black", highlightthickness=1, highlightcolor="white", justify=tk.CENTER)  # Set black background and center text
+        song_data = (song, difficulty, level, category)
+        # Saved to history on the I/O worker; the history tab is updated once it is written
+        drawn_at = io_worker.append_history([song_data], callback=add_history_entries,
+                                            error_callback=report_history_error)
+        remember_draw(song_data, drawn_at)
 
     else:
-        song_label.config(text="No songs found with the selected criteria.", font=default_font, width=600,
+        song_label.config(text=error_text or "No songs found with the selected criteria.", font=default_font, width=600,
                          height=150)  # Apply the default font
 
-def clear_history():
+def display_setlist():
     """
-    Clears the song history file and updates the history display.
+    Draws a whole setlist with the selected criteria in one batch and displays it.
+    The setlist is saved to the history with a single append.
     """
+    seed_text = setlist_seed_var.get().strip()
+    # Numeric seeds match the --seed option of randomizer_cli.py; empty means a fresh random setlist
+    rng = random.Random(int(seed_text) if seed_text.lstrip('-').isdigit() else seed_text or None)
+
+    setlist, error_text = [], None
+    drawn_at = time.time()
     try:
-        with open("history.txt", "w", encoding="utf-8") as file:
-            file.write("")  # Clear the file
-        history_listbox.delete(0, tk.END)  # Clear the listbox
+        index = current_index()
+        with METRICS.stage("draw"):
+            if recent_draws.enabled:
+                setlist = draw_setlist_without_repeats(index, drawn_at, rng)
+            else:
+                setlist = index.draw_many(current_filter(), setlist_size_var.get(), rng,
+                                          bool(unique_songs_var.get()), current_fairness())
+    except FileNotFoundError:
+        error_text = "Error: CSV file not found."
     except Exception as e:
-        print(f"An error occurred while clearing history: {e}")
+        error_text = f"An error occurred: {e}"
+    if setlist:
+        songs = [index.chart_tuple(chart) for chart in setlist]
+        display_text = "\n".join(f"{number}. {format_history_entry(song_data)}"
+                                 for number, song_data in enumerate(songs, start=1))
+        with METRICS.stage("render"):
+            song_label.config(text=display_text, font=history_font, fg="white",
+                             bg="black", highlightthickness=1, highlightcolor="white", justify=tk.LEFT)
+        io_worker.append_history(songs, drawn_at, callback=add_history_entries,  # One append for the whole setlist
+                                 error_callback=report_history_error)
+    else:
+        song_label.config(text=error_text or "No songs found with the selected criteria.", font=default_font, width=600,
+                         height=150)  # Apply the default font
 
-def update_history_display():
+def draw_setlist_without_repeats(index, drawn_at, rng):
     """
-    Updates the history tab with the contents of the history file.
+    Draws a setlist chart by chart through the no-repeat window, like randomizer_cli.py does, so it
+    avoids the recent draws and never holds the same chart twice. Each chart joins the window as it
+    is drawn. With "unique songs", a pick of a song already in the setlist is redrawn; the setlist
+    stops short if REPEAT_ATTEMPTS picks in a row hit such songs.
     """
-    history_data = load_history()
-    history_listbox.delete(0, tk.END)  # Clear the listbox
-    for song_data in reversed(history_data): # reversed the history data.
-        # Get the full category name
-        # full_category_name = full_category_names.get(song_data[3], {'full_name': song_data[3]}).get('full_name')
-        # display_text = f"{full_category_name}\n{song_data[0]} ({song_data[1]})\n"
-
-        display_text = f"[{song_data[3].strip()}] {song_data[0]} ({song_data[1]}) " # removed space
-        if "NM" in song_data[1] or "HD" in song_data[1] or "MX" in song_data[1]:
-            stars = "☆" * int(song_data[2])
-        elif "SC" in song_data[1]:
-            stars = "★" * int(song_data[2])
+    chart_filter, fairness = current_filter(), current_fairness()
+    unique_songs = bool(unique_songs_var.get())
+    setlist, songs = [], set()
+    for _ in range(setlist_size_var.get()):
+        for _ in range(REPEAT_ATTEMPTS):
+            chart = index.draw(chart_filter, rng, recent_draws, fairness)
+            if chart is None or not unique_songs or index.chart_song[chart] not in songs:
+                break
         else:
-            stars = "N/A"
-        stars = " ".join([stars[i:i+5] for i in range(0, len(stars), 5)])
-        display_text += stars
-        history_listbox.insert(tk.END, display_text)
+            break
+        if chart is None:
+            break
+        setlist.append(chart)
+        songs.add(index.chart_song[chart])
+        remember_draw(index.chart_tuple(chart), drawn_at)
+    return setlist
+
+def clear_history():
+    """
+    Clears the song history and updates the history display.
+    """
+    global pending_recent_draws
+    recent_draws.clear()
+    pending_recent_draws = None  # A no-repeat window still being read would hold the cleared draws
+    io_worker.clear_history(callback=lambda _: history_view.refresh(),
+                            error_callback=lambda e: print(f"An error occurred while clearing history: {e}"))
+
+def report_history_error(error):
+    """Called on the Tk thread when the I/O worker could not save draws to the history."""
+    print(f"An error occurred while saving to history: {error}")
+
+def reset_recent_draws(*args):
+    """
+    Rebuilds the no-repeat window from the end of the history when its settings change. The
+    history is read on the I/O worker; set_recent_draws installs the new window.
+    """
+    global pending_recent_draws
+    try:
+        max_draws, max_minutes = no_repeat_draws_var.get(), no_repeat_minutes_var.get()
+    except tk.TclError:
+        return  # The spinbox is being edited and does not hold a number yet
+    pending = pending_recent_draws = []  # Draws made until the window arrives; their writes are queued after the read
+    io_worker.submit_history(load_recent_draws, max(max_draws, 0), max(max_minutes, 0) * 60,
+                             callback=lambda recent: set_recent_draws(recent, pending))
+
+def set_recent_draws(recent, pending):
+    """Installs a no-repeat window read by reset_recent_draws, unless a newer one was requested."""
+    global recent_draws, pending_recent_draws
+    if pending is not pending_recent_draws:
+        return
+    for song_data, drawn_at in pending:
+        recent.add(song_data, drawn_at)
+    recent_draws, pending_recent_draws = recent, None
+
+def remember_draw(song_data, drawn_at):
+    """Adds a draw to the no-repeat window, and to the one still being read if there is one."""
+    recent_draws.add(song_data, drawn_at)
+    if pending_recent_draws is not None:
+        pending_recent_draws.append((song_data, drawn_at))
+
+def add_history_entries(entries):
+    """
+    Shows newly drawn history entries in the history tab. Only the visible rows are redrawn.
+
+    Args:
+        entries (List[HistoryEntry]): The new entries, oldest first.
+    """
+    with METRICS.stage("render"):
+        history_view.refresh(added=len(entries))
+
+def update_history_display():
+    """
+    Shows the most recent entries in the history tab; other rows are read when scrolled into view.
+    """
+    history_view.refresh()
+
+def on_metrics_toggle():
+    """Turns the instrumentation on or off from the Debug tab."""
+    if metrics_enabled_var.get():
+        METRICS.enable(bool(trace_allocations_var.get()))
+        refresh_metrics()
+    else:
+        METRICS.disable()
+
+def refresh_metrics():
+    """Shows the current stage percentiles in the Debug tab, once a second while recording."""
+    global metrics_refresh_id
+    if metrics_refresh_id is not None:
+        window.after_cancel(metrics_refresh_id)  # Called early (e.g. by a reset): keep a single refresh chain
+        metrics_refresh_id = None
+    metrics_text.config(state=tk.NORMAL)
+    metrics_text.delete("1.0", tk.END)
+    metrics_text.insert(tk.END, METRICS.format_summary())
+    if song_database:
+        cache_stats = song_database.index.filter_cache.stats()
+        metrics_text.insert(tk.END, f"\n\nFilter cache: {cache_stats['size']}/{cache_stats['capacity']} filters, "
+                                    f"{cache_stats['hits']} hits, {cache_stats['misses']} misses "
+                                    f"({cache_stats['hit_rate']:.0%}), {cache_stats['evictions']} evictions")
+    if profile_report:
+        metrics_text.insert(tk.END, "\n\nProfile of the last single draw:\n" + profile_report)
+    metrics_text.config(state=tk.DISABLED)
+    if METRICS.enabled:
+        metrics_refresh_id = window.after(1000, refresh_metrics)
+
+def profile_single_draw():
+    """Runs one 'Get Random Song' under cProfile and shows the report in the Debug tab."""
+    global profile_report
+    _, profile_report = profile_call(display_song)
+    refresh_metrics()
+
+def reset_metrics():
+    """Forgets every recorded sample and the last profile."""
+    global profile_report
+    METRICS.reset()
+    profile_report = ""
+    refresh_metrics()
+
+def save_metrics(extension):
+    """Writes the metrics summary next to the app as metrics-<date>-<time>.json or .csv."""
+    path = time.strftime("metrics-%Y%m%d-%H%M%S") + extension
+    try:
+        METRICS.dump(path)
+        metrics_status_label.config(text=f"Saved {os.path.abspath(path)}")
+    except OSError as e:
+        metrics_status_label.config(text=f"Could not save the metrics: {e}")
+
+profile_report = ""  # cProfile report of the last profiled draw
+metrics_refresh_id = None  # Pending after() call of refresh_metrics
+
+def refresh_stats(*args):
+    """
+    Folds the draws made since the last refresh into the statistics and shows them in the Stats tab.
+    Coverage is measured against the currently selected categories (all key modes and levels).
+    """
+    global stats_update
+    if notebook.select() != str(stats_tab) and args:
+        return  # Only recompute when the Stats tab is shown
+    if stats_update is not None:
+        # The worker is updating history_stats in place; show_stats refreshes again once it is done
+        stats_update = "again"
+        return
+    stats_update = "pending"
+    # Reading the new draws and saving the checkpoint run on the I/O worker, after any pending writes
+    io_worker.submit_history(load_history_stats, None, history_stats, callback=show_stats,
+                             error_callback=report_stats_error)
+
+def report_stats_error(error):
+    """Called on the Tk thread when the I/O worker could not update the statistics."""
+    global stats_update
+    stats_update = None
+    print(f"Could not update the statistics: {error}")
+
+def show_stats(stats):
+    """Shows the statistics returned by the I/O worker in the Stats tab."""
+    global history_stats, stats_update
+    history_stats = stats
+    refresh_again = stats_update == "again"
+    stats_update = None
+    pool = None
+    if song_database:
+        pool = ChartFilter(current_filter().selected_categories, "All", True, True, 1, 15, 1, 15)
+    stats_text.config(state=tk.NORMAL)
+    stats_text.delete("1.0", tk.END)
+    stats_text.insert(tk.END, history_stats.report(song_database.index if pool else None, pool,
+                                                   full_category_names, top=15))
+    stats_text.config(state=tk.DISABLED)
+    if refresh_again:
+        refresh_stats()  # Only now, as the worker changes history_stats while it updates them
+
+history_stats = None  # Loaded from its checkpoint the first time the Stats tab is shown
+stats_update = None  # "pending" while the I/O worker updates history_stats, "again" if asked to refresh meanwhile
+
+# Open the history (imports an old history.txt on the first start). After startup the Tk thread no
+# longer touches it: reads and writes go through the I/O worker and its own connection.
+history_store = HistoryStore()
+io_worker = IOWorker(history_store.db_file)
+io_worker.start()
+
+def poll_io_worker():
+    """Runs the callbacks of the I/O tasks that finished since the last poll."""
+    try:
+        io_worker.poll()
+    finally:
+        window.after(IO_POLL_MS, poll_io_worker)
+
+def on_close():
+    """Writes the draws still waiting in the I/O queue before the window closes."""
+    if not io_worker.close(timeout=IO_CLOSE_TIMEOUT):
+        print("Some draws could not be saved to history before closing.")
+    history_store.close()
+    window.destroy()
 
 # Create the main window
 window = tk.Tk()
 window.title("DJMAX RESPECT SONG RANDOMIZER")  # changed title
 window.geometry("1000x1000")  # Adjusted size
 window.resizable(False, False)  # Make the window fixed size
+window.protocol("WM_DELETE_WINDOW", on_close)
 
 # Use a default font
 default_font = ("Helvetica", 12)
@@ -260,32 +462,31 @@ notebook.add(main_tab, text="Main")
 history_tab = ttk.Frame(notebook)
 notebook.add(history_tab, text="History")
 
+# Stats tab
+stats_tab = ttk.Frame(notebook)
+notebook.add(stats_tab, text="Stats")
+notebook.bind("<<NotebookTabChanged>>", refresh_stats)
+
+# Debug tab (timings, allocations and profiling)
+debug_tab = ttk.Frame(notebook)
+notebook.add(debug_tab, text="Debug")
+
 # Category Selection Frame (Main Tab)
 category_frame = tk.Frame(main_tab)
 category_frame.pack(padx=10, fill=tk.BOTH, anchor='center')  # Center the frame
 
-# Load full category names
-full_category_names = load_full_category_names('CategoryNames.csv')  # Replace with your category CSV file name
-
-# Get all unique categories from the CSV
-all_songs = get_songs_by_categories('SongList.csv', ["All"], "", True, True, 1, 15, 1, 15)  # Initialize min and max to default values
-if "Error" not in all_songs:
-    try:
-        with open('SongList.csv', 'r', encoding='utf-8') as file:
-            reader = csv.reader(file)
-            header = next(reader)  # Skip header row
-            unique_categories = ["All"]  # Default option
-            for row in reader:
-                category = row[1]
-                if category not in unique_categories:
-                    unique_categories.append(category)
-            unique_categories.sort()  # Sort the categories
-    except FileNotFoundError:
-        unique_categories = ["Error: CSV not found"]
-    except Exception as e:
-        unique_categories = ["Error: " + str(e)]
-else:
-    unique_categories = ["Error reading CSV"]
+# Load the chart index and full category names, from the compiled cache when the CSVs are unchanged
+song_database = None
+try:
+    song_database = load_song_database(SONG_LIST_FILE, CATEGORY_NAMES_FILE)
+    full_category_names = song_database.full_category_names
+    unique_categories = sorted(["All"] + song_database.index.category_names)  # Sort the categories
+except FileNotFoundError:
+    full_category_names = load_full_category_names(CATEGORY_NAMES_FILE)
+    unique_categories = ["Error: CSV not found"]
+except Exception as e:
+    full_category_names = load_full_category_names(CATEGORY_NAMES_FILE)
+    unique_categories = ["Error: " + str(e)]
 
 # Variables and Toggle Buttons for Categories
 num_columns = 5
@@ -322,144 +523,212 @@ def on_toggle(category_name):
                     cat_button['variable'].set(0)
                     cat_button['button'].config(relief=tk.RAISED)
             break  # Exit the loop after finding the matching button
+    schedule_pool_update()
 
-# Create a dictionary to store categories based on their source
-categories_by_source = {}
-for short_name, category_data in full_category_names.items():
-    source = category_data['source']
-    if source not in categories_by_source:
-        categories_by_source[source] = []
-    categories_by_source[source].append(short_name) # changed from categories_by_source.append(short_name)
-
-# Iterate through the sources and create buttons, adding separators
-row_counter = 0
-# Ensure "All" is always the first category
-if "All" in unique_categories:
-    # Add "All" to the beginning of the first source's category list if it's not already there
-    first_source = list(categories_by_source.keys())[0]
-    if "All" not in categories_by_source[first_source]:
-        categories_by_source[first_source].insert(0, "All")
-    unique_categories.remove("All")  # Remove "All" from its original position
-    unique_categories.insert(0, "All")  # Add "All" to the beginning
-
-for source, category_list in categories_by_source.items():
-    # Skip the "All" category source, as we only want it displayed once
-    if source == "All":
-        continue
-
-    # Add a label for the source
-    source_label = tk.Label(category_frame, text=source, font=default_font,
-                            fg=separator_color)  # Apply the default font
-    source_label.grid(row=row_counter, column=0, columnspan=num_columns, sticky='w', padx=5, pady=5)
+def build_category_buttons():
+    """
+    (Re)builds the category toggle grid from full_category_names, grouped by source.
+    The current selection is kept; "All" is selected the first time.
+    """
+    global category_buttons
+    selected = {category['short_name'] for category in category_buttons if category['variable'].get() == 1} or {"All"}
+    for widget in category_frame.winfo_children():
+        widget.destroy()
+    category_buttons = []
+
+    # Create a dictionary to store categories based on their source
+    categories_by_source = {}
+    for short_name, category_data in full_category_names.items():
+        source = category_data['source']
+        if source not in categories_by_source:
+            categories_by_source[source] = []
+        categories_by_source[source].append(short_name) # changed from categories_by_source.append(short_name)
+
+    # Iterate through the sources and create buttons, adding separators
+    row_counter = 0
+    # Ensure "All" is always the first category
+    if "All" in unique_categories:
+        # Add "All" to the beginning of the first source's category list if it's not already there
+        first_source = list(categories_by_source.keys())[0]
+        if "All" not in categories_by_source[first_source]:
+            categories_by_source[first_source].insert(0, "All")
+        unique_categories.remove("All")  # Remove "All" from its original position
+        unique_categories.insert(0, "All")  # Add "All" to the beginning
+
+    for source, category_list in categories_by_source.items():
+        # Skip the "All" category source, as we only want it displayed once
+        if source == "All":
+            continue
+
+        # Add a label for the source
+        source_label = tk.Label(category_frame, text=source, font=default_font,
+                                fg=separator_color)  # Apply the default font
+        source_label.grid(row=row_counter, column=0, columnspan=num_columns, sticky='w', padx=5, pady=5)
+        row_counter += 1
+
+        # Add buttons for the categories in the source
+        for i, category in enumerate(category_list):
+            var = tk.IntVar(value=1 if category in selected else 0)  # "All" is initially selected
+            col = i % num_columns
+            row = row_counter + i // num_columns
+            display_text = full_category_names[category]['full_name']
+            btn = tk.Button(category_frame, text=display_text, relief=tk.SUNKEN if category in selected else tk.RAISED,
+                            bd=2, width=button_width,
+                            height=int(button_height),  # Changed here
+                            command=lambda cat_name=category: on_toggle(cat_name), font=default_font)  # Apply the default font
+            category_buttons.append({
+                'variable': var,
+                'short_name': category,
+                'button': btn
+            })
+            btn.grid(row=row, column=col, sticky='nsew', padx=5, pady=2)
+        row_counter = row + 1
+
+        # Add a separator line
+        separator = tk.Frame(category_frame, height=2, bg=separator_color)
+        separator.grid(row=row_counter, column=0, columnspan=num_columns, sticky='ew', padx=5, pady=5)
+        row_counter += 1
+
+    #  Add the "All Categories" button separately, at the bottom
+    all_category_button = tk.Button(category_frame, text="All Categories",
+                                     relief=tk.SUNKEN if "All" in selected else tk.RAISED, bd=2,
+                                     width=button_width, height=int(button_height),
+                                     command=lambda cat_name="All": on_toggle(cat_name),
+                                     font=default_font)
+    category_buttons.insert(0, {
+        'variable': tk.IntVar(value=1 if "All" in selected else 0),
+        'short_name': "All",
+        'button': all_category_button
+    })
+    all_category_button.grid(row=row_counter, column=0, columnspan=num_columns, sticky='nsew', padx=5, pady=2)
     row_counter += 1
 
-    # Add buttons for the categories in the source
-    for i, category in enumerate(category_list):
-        var = tk.IntVar(value=0 if category != "All" else 1)  # "All" is initially selected
-        col = i % num_columns
-        row = row_counter + i // num_columns
-        display_text = full_category_names[category]['full_name']
-        btn = tk.Button(category_frame, text=display_text, relief=tk.RAISED, bd=2, width=button_width,
-                        height=int(button_height),  # Changed here
-                        command=lambda cat_name=category: on_toggle(cat_name), font=default_font)  # Apply the default font
-        category_buttons.append({
-            'variable': var,
-            'short_name': category,
-            'button': btn
-        })
-        btn.grid(row=row, column=col, sticky='nsew', padx=5, pady=2)
-    row_counter = row + 1
-
-    # Add a separator line
-    separator = tk.Frame(category_frame, height=2, bg=separator_color)
-    separator.grid(row=row_counter, column=0, columnspan=num_columns, sticky='ew', padx=5, pady=5)
-    row_counter += 1
+    # Configure grid weights to center content
+    for i in range(num_columns):
+        category_frame.columnconfigure(i, weight=1)
+    for i in range(row_counter):
+        category_frame.rowconfigure(i, weight=1)
 
-#  Add the "All Categories" button separately, at the bottom
-all_category_button = tk.Button(category_frame, text="All Categories", relief=tk.RAISED, bd=2,
-                                 width=button_width, height=int(button_height),
-                                 command=lambda cat_name="All": on_toggle(cat_name),
-                                 font=default_font)
-category_buttons.insert(0, {
-    'variable': tk.IntVar(value=1),
-    'short_name': "All",
-    'button': all_category_button
-})
-all_category_button.grid(row=row_counter, column=0, columnspan=num_columns, sticky='nsew', padx=5, pady=2)
-row_counter += 1
-
-# Configure grid weights to center content
-for i in range(num_columns):
-    category_frame.columnconfigure(i, weight=1)
-for i in range(row_counter):
-    category_frame.rowconfigure(i, weight=1)
+build_category_buttons()
 
 # Key Mode Selection (Main Tab)
-key_mode_frame = tk.Frame(main_tab)  # Create a frame for label and dropdown
+key_mode_frame = tk.Frame(main_tab)  # Create a frame for the label and toggles
 key_mode_frame.pack(pady=5)
 
-key_mode_label = tk.Label(key_mode_frame, text="Select Key Mode:", font=default_font)  # Apply the default font
+key_mode_label = tk.Label(key_mode_frame, text="Key Modes:", font=default_font)  # Apply the default font
 key_mode_label.pack(side=tk.LEFT, padx=(0, 5))  # Pack label to the left with some right padding
-key_mode_var = tk.StringVar(window)
-key_mode_choices = ["All", "4B", "5B", "6B", "8B"]
-key_mode_dropdown = ttk.Combobox(key_mode_frame, textvariable=key_mode_var, values=key_mode_choices,
-                                  font=default_font)  # Apply the default font
-key_mode_dropdown.pack(side=tk.LEFT, padx=(0, 10))  # Pack dropdown to the left
-
-key_mode_dropdown.set("All")  # Default selection
-
-# Level Selection Frame (Main Tab)
+key_mode_vars = {}  # Key mode -> IntVar of its toggle; any combination can be selected
+for key_mode in KEY_MODES:
+    key_mode_vars[key_mode] = tk.IntVar(value=1)
+    key_mode_toggle = tk.Checkbutton(key_mode_frame, text=key_mode, variable=key_mode_vars[key_mode],
+                                     font=default_font)
+    key_mode_toggle.pack(side=tk.LEFT, padx=(0, 10))
+
+# Difficulty and Level Selection Frame (Main Tab): one row per difficulty, each with its own level range
 level_frame = tk.Frame(main_tab)
 level_frame.pack(pady=10)
 
-# NM/HD/MX and SC Frames (Main Tab)
-nm_hd_mx_frame = tk.Frame(level_frame)
-nm_hd_mx_frame.pack(side=tk.LEFT, padx=10)
-
-sc_frame = tk.Frame(level_frame)
-sc_frame.pack(side=tk.LEFT, padx=10)
-
-# NM/HD/MX Toggle and Level Selection (Main Tab)
-nm_hd_mx_toggle_var = tk.IntVar(value=1)
-nm_hd_mx_toggle = tk.Checkbutton(nm_hd_mx_frame, text="Include NM/HD/MX", variable=nm_hd_mx_toggle_var,
-                                  font=default_font)  # Apply the default font
-nm_hd_mx_toggle.grid(row=0, column=0, sticky='w')  # Use grid for layout
-
-nm_hd_mx_level_label = tk.Label(nm_hd_mx_frame, text="Level:", font=default_font)  # Apply the default font
-nm_hd_mx_level_label.grid(row=0, column=1, sticky='w')  # Label on the right
-
-nm_hd_mx_min_level_var = tk.IntVar(value=1)
-nm_hd_mx_min_level_spinbox = tk.Spinbox(nm_hd_mx_frame, from_=1, to=15, textvariable=nm_hd_mx_min_level_var,
-                                         width=5, font=default_font)  # Apply the default font
-nm_hd_mx_min_level_spinbox.grid(row=0, column=2, sticky='w')
-nm_hd_mx_max_level_var = tk.IntVar(value=15)
-nm_hd_mx_max_level_spinbox = tk.Spinbox(nm_hd_mx_frame, from_=1, to=15, textvariable=nm_hd_mx_max_level_var,
-                                         width=5, font=default_font)  # Apply the default font
-nm_hd_mx_max_level_spinbox.grid(row=0, column=3, sticky='w')
-
-# SC Toggle and Level Selection (Main Tab)
-sc_toggle_var = tk.IntVar(value=1)
-sc_toggle = tk.Checkbutton(sc_frame, text="Include SC", variable=sc_toggle_var,
-                            font=default_font)  # Apply the default font
-sc_toggle.grid(row=0, column=0, sticky='w')  # Use grid for layout
-
-sc_level_label = tk.Label(sc_frame, text="Level:", font=default_font)  # Apply the default font
-sc_level_label.grid(row=0, column=1, sticky='w')# Label on the right
-
-sc_min_level_var = tk.IntVar(value=1)
-sc_min_level_spinbox = tk.Spinbox(sc_frame, from_=1, to=15, textvariable=sc_min_level_var, width=5,
-                                   font=default_font)  # Apply the default font
-sc_min_level_spinbox.grid(row=0, column=2, sticky='w')
-sc_max_level_var = tk.IntVar(value=15)
-sc_max_level_spinbox = tk.Spinbox(sc_frame, from_=1, to=15, textvariable=sc_max_level_var, width=5,
-                                   font=default_font)  # Apply the default font
-sc_max_level_spinbox.grid(row=0, column=3, sticky='w')
+difficulty_rows = {}  # Difficulty -> its toggle and level variables
+for row, diff in enumerate(DIFFICULTIES):
+    toggle_var = tk.IntVar(value=1)
+    difficulty_toggle = tk.Checkbutton(level_frame, text=f"Include {diff}", variable=toggle_var,
+                                       fg=DIFFICULTY_COLORS[diff], font=default_font)
+    difficulty_toggle.grid(row=row, column=0, sticky='w')
+    difficulty_level_label = tk.Label(level_frame, text="Level:", font=default_font)
+    difficulty_level_label.grid(row=row, column=1, sticky='w', padx=(10, 5))
+    min_level_var = tk.IntVar(value=1)
+    min_level_spinbox = tk.Spinbox(level_frame, from_=1, to=15, textvariable=min_level_var, width=5,
+                                   font=default_font)
+    min_level_spinbox.grid(row=row, column=2, sticky='w')
+    max_level_var = tk.IntVar(value=15)
+    max_level_spinbox = tk.Spinbox(level_frame, from_=1, to=15, textvariable=max_level_var, width=5,
+                                   font=default_font)
+    max_level_spinbox.grid(row=row, column=3, sticky='w')
+    difficulty_rows[diff] = {'toggle_var': toggle_var, 'min_var': min_level_var, 'max_var': max_level_var}
+
+# Matching pool counter (Main Tab)
+POOL_UPDATE_DELAY_MS = 100  # Debounce, so that holding a spinbox arrow stays smooth
+pool_update_id = None  # Pending after() call of update_pool_counter
+pool_label = tk.Label(main_tab, text="", font=default_font)
+pool_label.pack(pady=5)
+for filter_var in list(key_mode_vars.values()) + [variable for difficulty_row in difficulty_rows.values()
+                                                  for variable in difficulty_row.values()]:
+    filter_var.trace_add("write", schedule_pool_update)
+
+# Sampling fairness (Main Tab)
+fairness_frame = tk.Frame(main_tab)
+fairness_frame.pack(pady=5)
+
+fairness_label = tk.Label(fairness_frame, text="Equal chance per:", font=default_font)
+fairness_label.pack(side=tk.LEFT, padx=(0, 5))
+fairness_choices = {"Chart": "chart", "Song": "song", "Category": "category", "Category (custom weights)": "custom"}
+fairness_var = tk.StringVar(window)
+fairness_dropdown = ttk.Combobox(fairness_frame, textvariable=fairness_var, values=list(fairness_choices),
+                                 state="readonly", font=default_font)
+fairness_dropdown.pack(side=tk.LEFT, padx=(0, 10))
+fairness_dropdown.set("Chart")  # Default selection
+
+category_weights_label = tk.Label(fairness_frame, text="Weights:", font=default_font)
+category_weights_label.pack(side=tk.LEFT, padx=(0, 5))
+category_weights_var = tk.StringVar(window)  # e.g. "RP=2, VE=0.5"; unlisted categories weigh 1
+category_weights_entry = tk.Entry(fairness_frame, textvariable=category_weights_var, width=25, font=default_font)
+category_weights_entry.pack(side=tk.LEFT)
+
+# No-repeat window (Main Tab); 0 turns a limit off
+no_repeat_frame = tk.Frame(main_tab)
+no_repeat_frame.pack(pady=5)
+
+no_repeat_label = tk.Label(no_repeat_frame, text="No repeats within the last", font=default_font)
+no_repeat_label.pack(side=tk.LEFT, padx=(0, 5))
+no_repeat_draws_var = tk.IntVar(value=0)
+no_repeat_draws_spinbox = tk.Spinbox(no_repeat_frame, from_=0, to=1000, textvariable=no_repeat_draws_var, width=5,
+                                     font=default_font)
+no_repeat_draws_spinbox.pack(side=tk.LEFT)
+no_repeat_draws_label = tk.Label(no_repeat_frame, text="draws or", font=default_font)
+no_repeat_draws_label.pack(side=tk.LEFT, padx=5)
+no_repeat_minutes_var = tk.IntVar(value=0)
+no_repeat_minutes_spinbox = tk.Spinbox(no_repeat_frame, from_=0, to=1440, textvariable=no_repeat_minutes_var,
+                                       width=5, font=default_font)
+no_repeat_minutes_spinbox.pack(side=tk.LEFT)
+no_repeat_minutes_label = tk.Label(no_repeat_frame, text="minutes", font=default_font)
+no_repeat_minutes_label.pack(side=tk.LEFT, padx=5)
+
+recent_draws = load_recent_draws(history_store)  # Disabled until a limit is set
+pending_recent_draws = None  # Draws made while reset_recent_draws reads a new window
+no_repeat_draws_var.trace_add("write", reset_recent_draws)
+no_repeat_minutes_var.trace_add("write", reset_recent_draws)
 
 # Button to get a random song (Main Tab)
 get_song_button = tk.Button(main_tab, text="Get Random Song", command=display_song,
                             font=default_font)  # Apply the default font
 get_song_button.pack(pady=10)
 
+# Setlist (batch draw) controls (Main Tab)
+setlist_frame = tk.Frame(main_tab)
+setlist_frame.pack(pady=5)
+
+setlist_size_label = tk.Label(setlist_frame, text="Setlist size:", font=default_font)
+setlist_size_label.pack(side=tk.LEFT, padx=(0, 5))
+setlist_size_var = tk.IntVar(value=5)
+setlist_size_spinbox = tk.Spinbox(setlist_frame, from_=1, to=20, textvariable=setlist_size_var, width=5,
+                                  font=default_font)
+setlist_size_spinbox.pack(side=tk.LEFT, padx=(0, 10))
+
+setlist_seed_label = tk.Label(setlist_frame, text="Seed:", font=default_font)
+setlist_seed_label.pack(side=tk.LEFT, padx=(0, 5))
+setlist_seed_var = tk.StringVar(window)
+setlist_seed_entry = tk.Entry(setlist_frame, textvariable=setlist_seed_var, width=10, font=default_font)
+setlist_seed_entry.pack(side=tk.LEFT, padx=(0, 10))
+
+unique_songs_var = tk.IntVar(value=1)
+unique_songs_toggle = tk.Checkbutton(setlist_frame, text="No duplicate songs", variable=unique_songs_var,
+                                     font=default_font)
+unique_songs_toggle.pack(side=tk.LEFT, padx=(0, 10))
+
+get_setlist_button = tk.Button(setlist_frame, text="Get Random Setlist", command=display_setlist,
+                               font=default_font)
+get_setlist_button.pack(side=tk.LEFT)
+
 # Label to display the song title (Main Tab)
 song_label = tk.Label(main_tab, text="Click 'Get Random Song' to choose a song.", bg="black", fg="white",
                        width=600, height=150, font=default_font)  # set default bg to black and fixed size # Apply the default font
@@ -469,12 +738,50 @@ song_label.pack(pady=10)
 history_label = tk.Label(history_tab, text="Song History", font=title_font)
 history_label.pack(pady=10)
 
-history_listbox = tk.Listbox(history_tab, width=80, height=20, bg="gray", font=history_font)
-history_listbox.pack(pady=10, padx=10)
+# Only the visible rows are read from the history and drawn, however long the history is
+history_view = HistoryView(history_tab, io_worker.submit_history, rows=20, width=900, font=history_font, bg="gray")
+history_view.pack(pady=10, padx=10)
 
 clear_history_button = tk.Button(history_tab, text="Clear History", command=clear_history, font=default_font)
 clear_history_button.pack(pady=10)
 
+# Stats Tab Content
+stats_label = tk.Label(stats_tab, text="Statistics", font=title_font)
+stats_label.pack(pady=10)
+stats_text = tk.Text(stats_tab, width=90, height=36, font=("Courier", 11), bg="black", fg="white")
+stats_text.pack(padx=10)
+refresh_stats_button = tk.Button(stats_tab, text="Refresh", command=refresh_stats, font=default_font)
+refresh_stats_button.pack(pady=10)
+
+# Debug Tab Content
+metrics_controls_frame = tk.Frame(debug_tab)
+metrics_controls_frame.pack(pady=10)
+
+metrics_enabled_var = tk.IntVar(value=int(METRICS.enabled))
+metrics_enabled_toggle = tk.Checkbutton(metrics_controls_frame, text="Record timings", variable=metrics_enabled_var,
+                                        command=on_metrics_toggle, font=default_font)
+metrics_enabled_toggle.pack(side=tk.LEFT, padx=(0, 10))
+trace_allocations_var = tk.IntVar(value=0)
+trace_allocations_toggle = tk.Checkbutton(metrics_controls_frame, text="Trace allocations (slower)",
+                                          variable=trace_allocations_var, command=on_metrics_toggle, font=default_font)
+trace_allocations_toggle.pack(side=tk.LEFT, padx=(0, 10))
+profile_button = tk.Button(metrics_controls_frame, text="Profile One Draw", command=profile_single_draw,
+                           font=default_font)
+profile_button.pack(side=tk.LEFT, padx=(0, 10))
+reset_metrics_button = tk.Button(metrics_controls_frame, text="Reset", command=reset_metrics, font=default_font)
+reset_metrics_button.pack(side=tk.LEFT, padx=(0, 10))
+save_json_button = tk.Button(metrics_controls_frame, text="Save JSON", command=lambda: save_metrics(".json"),
+                             font=default_font)
+save_json_button.pack(side=tk.LEFT, padx=(0, 10))
+save_csv_button = tk.Button(metrics_controls_frame, text="Save CSV", command=lambda: save_metrics(".csv"),
+                            font=default_font)
+save_csv_button.pack(side=tk.LEFT)
+
+metrics_text = tk.Text(debug_tab, width=110, height=40, font=("Courier", 10), bg="black", fg="white")
+metrics_text.pack(padx=10, pady=10)
+metrics_status_label = tk.Label(debug_tab, text="", font=("Helvetica", 10), fg="gray")
+metrics_status_label.pack()
+
 # Credits Label
 credits_label = tk.Label(history_tab,
                         text="DJMAX Song Randomizer ver. 2.1.2\nCreated with Google Gemini by Toshiyuki Doma\nLast Update: 2025/03/31",
@@ -484,6 +791,28 @@ credits_label.place(relx=1.0, rely=1.0, anchor=tk.SE, x=-10, y=-10)  # Position
 
 # Initial population of history
 update_history_display()
+update_pool_counter()
+refresh_metrics()
+
+# Startup time report (Main Tab, bottom left)
+startup_text = f"Startup: {(time.perf_counter() - startup_started) * 1000:.0f} ms"
+if song_database:
+    startup_text += (f" (song list: {len(song_database.index)} charts in {song_database.load_seconds * 1000:.1f} ms"
+                     f"{' from cache' if song_database.from_cache else ', cache rebuilt'})")
+print(startup_text)
+startup_label = tk.Label(main_tab, text=startup_text, font=("Helvetica", 10), fg="gray")
+startup_label.place(relx=0.0, rely=1.0, anchor=tk.SW, x=10, y=-10)  # Position at bottom left
+
+# Watch the song list and category names for updates
+SOURCE_POLL_MS = 2000
+source_signatures = read_source_signatures()
+pending_signatures = source_signatures
+window.after(SOURCE_POLL_MS, check_source_files)
+
+# Deliver the results of the background history and song list I/O
+IO_POLL_MS = 50
+IO_CLOSE_TIMEOUT = 10  # Seconds to wait for pending writes when the window is closed
+window.after(IO_POLL_MS, poll_io_worker)
 
 # Run the GUI loop
 window.mainloop()
@@ -0,0 +1,226 @@
+"""
+Benchmarks for the randomizer on synthetic song databases.
+
+Generates SongList.csv / CategoryNames.csv files in the real 18-column layout and legacy
+history.txt files of any size in a temporary directory, then measures cold start, filtering,
+drawing and history loading. Results are printed (or written) as JSON so runs can be compared
+between song list updates.
+
+Example:
+    python randomizer_bench.py --sizes 700 100000 1000000 --history-sizes 100000 --output bench.json
+"""
+import argparse
+import csv
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List
+from randomizer_core import (KEY_MODES, DIFFICULTIES, ChartFilter, ChartIndex, Fairness, RecentDraws,
+                             get_songs_by_categories, load_history, format_history_entry)
+from randomizer_cache import load_song_database
+from randomizer_history import HistoryStore
+from randomizer_draft import draft_rounds
+
+SOURCES = ["LEGACY", "NEW", "MUSIC GAME COLLABORATION", "VARIETY COLLABORATION"]
+SONGS_PER_CATEGORY = 20  # Roughly the size of a real DLC pack
+
+# Filter combinations measured for every database size
+FILTERS = {
+    "all": ChartFilter(("All",), "All", True, True, 1, 15, 1, 15),
+    "one_key_mode": ChartFilter(("All",), "6B", True, True, 1, 15, 1, 15),
+    "few_categories": ChartFilter(("C0", "C1", "C2", "C3", "C4"), "All", True, True, 1, 15, 1, 15),
+    "narrow_levels": ChartFilter(("All",), "4B", True, False, 12, 13, 1, 15),
+    "sc_only": ChartFilter(("All",), "All", False, True, 1, 15, 8, 12),
+}
+
+DRAFT_CURVE = ((1, 5), (6, 8), (9, 11), (12, 13), (14, 15))  # Level range of each round of the benchmarked drafts
+
+
+def generate_song_list(path, songs: int, rng: random.Random) -> List[str]:
+    """
+    Writes a synthetic song list with the same columns as SongList.csv.
+
+    Returns:
+        List[str]: The generated category names.
+    """
+    categories = [f"C{number}" for number in range(max(1, songs // SONGS_PER_CATEGORY))]
+    header = ["Title", "Category"] + [f"{key_mode} {diff}" for key_mode in KEY_MODES for diff in DIFFICULTIES]
+    with open(path, "w", encoding="utf-8", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(header)
+        for song in range(songs):
+            levels = []
+            for _ in KEY_MODES:
+                normal = rng.randint(1, 8)
+                hard = min(normal + rng.randint(1, 4), 15)
+                maximum = min(hard + rng.randint(0, 4), 15)
+                special = rng.randint(1, 15) if rng.random() < 0.8 else 0  # Not every song has SC charts
+                levels += [normal, hard, maximum, special]
+            title = f"Song {song}, Part {song % 7}" if song % 50 == 0 else f"Song {song}"  # Some titles need quoting
+            writer.writerow([title, categories[song % len(categories)]] + levels)
+    return categories
+
+
+def generate_category_names(path, categories: List[str]):
+    """Writes a synthetic CategoryNames.csv for the given categories."""
+    with open(path, "w", encoding="utf-8", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["Category", "Full Category Name", "Source"])
+        for number, category in enumerate(categories):
+            writer.writerow([category, f"CATEGORY {number}", SOURCES[number % len(SOURCES)]])
+
+
+def generate_history(path, entries: int, index: ChartIndex, rng: random.Random):
+    """Writes a legacy comma-separated history.txt with random charts from the index."""
+    with open(path, "w", encoding="utf-8") as file:
+        for _ in range(entries):
+            song_data = index.chart_tuple(rng.randrange(len(index)))
+            file.write(f"{song_data[0]},{song_data[1]},{song_data[2]}, {song_data[3]}\n")
+
+
+def measure(function: Callable, repeat: int) -> Dict[str, float]:
+    """
+    Calls function repeat times.
+
+    Returns:
+        Dict[str, float]: min, median, mean and p95 wall time in milliseconds.
+    """
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return {"min_ms": samples[0], "median_ms": statistics.median(samples), "mean_ms": statistics.fmean(samples),
+            "p95_ms": samples[min(len(samples) - 1, int(len(samples) * 0.95))], "runs": repeat}
+
+
+def bench_song_list(directory, songs: int, repeat: int, draws: int, rng: random.Random) -> Dict:
+    """Benchmarks cold start, filtering and drawing for one synthetic song list size."""
+    song_file = os.path.join(directory, f"SongList_{songs}.csv")
+    category_file = os.path.join(directory, f"CategoryNames_{songs}.csv")
+    cache_file = os.path.join(directory, f"SongList_{songs}.cache")
+    generate_category_names(category_file, generate_song_list(song_file, songs, rng))
+
+    result = {"songs": songs}
+    started = time.perf_counter()
+    index = ChartIndex.from_csv(song_file)
+    index.build_buckets()
+    result["cold_start_csv_ms"] = (time.perf_counter() - started) * 1000
+    result["charts"] = len(index)
+    result["cold_start_cache_build_ms"] = load_song_database(song_file, category_file, cache_file).load_seconds * 1000
+    database = load_song_database(song_file, category_file, cache_file)
+    assert database.from_cache
+    result["cold_start_cache_ms"] = database.load_seconds * 1000
+    result["cache_bytes"] = os.path.getsize(cache_file)
+    index = database.index
+
+    result["filter"] = {}
+    for name, chart_filter in FILTERS.items():
+        arguments = (song_file, list(chart_filter.selected_categories)) + tuple(chart_filter[1:])
+        result["filter"][name] = {
+            "matching_charts": index.count(chart_filter),
+            "get_songs_by_categories": measure(lambda: get_songs_by_categories(*arguments), repeat),
+            "count": measure(lambda: index.count(chart_filter), repeat),
+        }
+
+    chart_filter = FILTERS["all"]
+    result["draw"] = {}
+    for mode in ("chart", "song", "category"):
+        fairness = Fairness(mode)
+        started = time.perf_counter()
+        index.sampler(chart_filter, fairness)  # First use of this fairness for the filter, so a full build
+        result["draw"][mode] = {
+            "sampler_build_ms": (time.perf_counter() - started) * 1000,
+            "per_draw_us": measure(lambda: index.draw_many(chart_filter, draws, rng, fairness=fairness), 3)["median_ms"]
+                           * 1000 / draws,
+        }
+    recent = RecentDraws(max_draws=100)
+    for _ in range(100):
+        recent.add(index.chart_tuple(index.draw(chart_filter, rng)))
+
+    def draw_no_repeat():
+        for _ in range(draws):
+            recent.add(index.chart_tuple(index.draw(chart_filter, rng, recent)))
+    result["draw"]["no_repeat_100"] = {"per_draw_us": measure(draw_no_repeat, 3)["median_ms"] * 1000 / draws}
+    result["draw"]["setlists_100x10_unique"] = measure(
+        lambda: index.draw_setlists(chart_filter, 100, 10, rng, unique_songs=True), 3)
+    # Tournament drafts with a rising level curve and no song used twice
+    result["draft"] = {name: measure(lambda: draft_rounds(index, chart_filter, setlists, DRAFT_CURVE, rng), 3)
+                       for name, setlists in (("16x5", 16), ("100x5", 100))}
+    return result
+
+
+def bench_history(directory, entries: int, index: ChartIndex, repeat: int, rng: random.Random) -> Dict:
+    """Benchmarks importing, loading and rendering a history of the given size."""
+    legacy_file = os.path.join(directory, f"history_{entries}.txt")
+    db_file = os.path.join(directory, f"history_{entries}.db")
+    generate_history(legacy_file, entries, index, rng)
+    result = {"entries": entries, "legacy_bytes": os.path.getsize(legacy_file)}
+    result["load_legacy_all"] = measure(lambda: load_history(legacy_file), min(repeat, 3))
+
+    started = time.perf_counter()
+    store = HistoryStore(db_file, legacy_file)
+    result["import_legacy_ms"] = (time.perf_counter() - started) * 1000
+    store.close()
+
+    result["open"] = measure(lambda: HistoryStore(db_file, None).close(), repeat)
+    store = HistoryStore(db_file, None)
+    result["load_tail_200"] = measure(lambda: store.tail(200), repeat)
+    result["render_tail_200"] = measure(lambda: [format_history_entry(entry) for entry in store.tail(200)], repeat)
+    oldest = store.tail(entries // 2)[-1].entry_id if entries > 1 else 1
+    result["load_page_middle_200"] = measure(lambda: store.before(oldest, 200), repeat)
+    result["append_one"] = measure(lambda: store.append(index.chart_tuple(0)), repeat)
+    result["load_all"] = measure(lambda: store.tail(-1), 1)
+    store.close()
+    return result
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the randomizer on synthetic song databases.")
+    parser.add_argument("--sizes", nargs="+", type=int, default=[700, 10000, 100000], metavar="SONGS",
+                        help="Song list sizes (rows) to generate. Default: 700 10000 100000.")
+    parser.add_argument("--history-sizes", nargs="+", type=int, default=[1000, 100000], metavar="ENTRIES",
+                        help="History sizes (draws) to generate. Default: 1000 100000.")
+    parser.add_argument("--repeat", type=int, default=20, help="Runs per latency measurement. Default: 20.")
+    parser.add_argument("--draws", type=int, default=10000, help="Draws per draw-latency measurement. Default: 10000.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the synthetic data. Default: 0.")
+    parser.add_argument("--output", help="Write the JSON results to this file instead of stdout.")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    results = {
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "seed": args.seed,
+        "song_lists": [],
+        "history": [],
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        for songs in args.sizes:
+            print(f"Benchmarking a song list of {songs} songs...", file=sys.stderr)
+            results["song_lists"].append(bench_song_list(directory, songs, args.repeat, args.draws, rng))
+        if args.history_sizes:
+            # History entries are drawn from the smallest song list
+            index = ChartIndex.from_csv(os.path.join(directory, f"SongList_{min(args.sizes)}.csv"))
+            for entries in args.history_sizes:
+                print(f"Benchmarking a history of {entries} draws...", file=sys.stderr)
+                results["history"].append(bench_history(directory, entries, index, args.repeat, rng))
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(output + "\n")
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
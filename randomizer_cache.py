@@ -0,0 +1,206 @@
+"""
+Compiled binary cache of the song database for fast cold starts.
+
+The parsed SongList.csv (as a ChartIndex, buckets included) and CategoryNames.csv are written to
+SongList.cache as a fixed header followed by raw array sections. On the next start the file is
+memory-mapped and the arrays are copied straight out of it instead of re-tokenizing the CSVs.
+The cache is rebuilt only when a CSV's modification time or size changes and its SHA-1 no longer
+matches the one recorded in the cache.
+"""
+import hashlib
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+from typing import Dict, NamedTuple, Optional, Tuple
+from randomizer_core import (SONG_LIST_FILE, CATEGORY_NAMES_FILE, ChartIndex, load_full_category_names,
+                             set_chart_index, file_signature)
+from randomizer_metrics import METRICS
+
+CACHE_MAGIC = b"DJMXIDX1"
+CACHE_VERSION = 1
+# Byte order and array item sizes; a cache written on another platform is rebuilt
+CACHE_LAYOUT = f"{sys.byteorder}:{array('B').itemsize}{array('H').itemsize}{array('I').itemsize}".encode()
+
+# magic, version, layout, (mtime_ns, size, sha1) for the song list and the category names, level slots
+_HEADER = struct.Struct("<8sI16s qq20s qq20s I")
+# Array sections in file order, with their typecodes
+_ARRAY_SECTIONS = [("song_category", 'H'), ("chart_song", 'I'), ("chart_category", 'H'),
+                   ("chart_key_mode", 'B'), ("chart_difficulty", 'B'), ("chart_level", 'B'),
+                   ("bucket_offsets", 'I'), ("bucket_charts", 'I')]
+# Text sections: titles, category names, category name rows (short name, full name, source)
+_TEXT_SECTIONS = 3
+_SECTION_LENGTHS = struct.Struct(f"<{len(_ARRAY_SECTIONS) + _TEXT_SECTIONS}Q")
+_SEPARATOR = "\0"
+
+
+class SongDatabase(NamedTuple):
+    """The loaded song data and how it was loaded."""
+    index: ChartIndex
+    full_category_names: Dict[str, Dict[str, str]]  # As returned by load_full_category_names
+    load_seconds: float
+    from_cache: bool
+
+
+def default_cache_file(song_file) -> str:
+    """Returns the cache path used for a song list, e.g. "SongList.cache" next to "SongList.csv"."""
+    return os.path.splitext(song_file)[0] + ".cache"
+
+
+def _file_hash(path) -> bytes:
+    try:
+        with open(path, "rb") as file:
+            return hashlib.sha1(file.read()).digest()
+    except FileNotFoundError:
+        return b"\0" * 20
+
+
+def _source_state(path, mtime_ns: int, size: int, sha1: bytes) -> Optional[str]:
+    """
+    Compares a source file with the signature stored in the cache.
+
+    Returns:
+        Optional[str]: "same" if mtime and size match, "touched" if only the content hash still
+                       matches, or None if the file changed.
+    """
+    if file_signature(path) == (mtime_ns, size):
+        return "same"
+    if _file_hash(path) == sha1:
+        return "touched"
+    return None
+
+
+def write_cache(cache_file, song_file, category_file, index: ChartIndex,
+                full_category_names: Dict[str, Dict[str, str]]):
+    """
+    Writes the compiled cache for the given sources. The file is replaced atomically.
+
+    Args:
+        cache_file (str): The path of the cache file.
+        song_file (str): The song list CSV the index was built from.
+        category_file (str): The category names CSV.
+        index (ChartIndex): The parsed song list.
+        full_category_names (Dict[str, Dict[str, str]]): The parsed category names.
+    """
+    if index.bucket_offsets is None:
+        index.build_buckets()
+    song_mtime, song_size = file_signature(song_file) or (0, 0)
+    category_mtime, category_size = file_signature(category_file) or (0, 0)
+    header = _HEADER.pack(CACHE_MAGIC, CACHE_VERSION, CACHE_LAYOUT,
+                          song_mtime, song_size, _file_hash(song_file),
+                          category_mtime, category_size, _file_hash(category_file),
+                          index.level_slots)
+    sections = [getattr(index, name).tobytes() for name, _ in _ARRAY_SECTIONS]
+    category_rows = [field for short_name, names in full_category_names.items()
+                     for field in (short_name, names['full_name'], names['source'])]
+    sections += [_SEPARATOR.join(strings).encode("utf-8")
+                 for strings in (index.titles, index.category_names, category_rows)]
+
+    temp_file = cache_file + ".tmp"
+    with open(temp_file, "wb") as file:
+        file.write(header)
+        file.write(_SECTION_LENGTHS.pack(*(len(section) for section in sections)))
+        for section in sections:
+            file.write(section)
+    os.replace(temp_file, cache_file)
+
+
+def read_cache(cache_file, song_file, category_file) -> Optional[Tuple[ChartIndex, Dict[str, Dict[str, str]], bool]]:
+    """
+    Loads the song database from the compiled cache if it is still valid for the sources.
+
+    Args:
+        cache_file (str): The path of the cache file.
+        song_file (str): The song list CSV the cache must match.
+        category_file (str): The category names CSV the cache must match.
+
+    Returns:
+        Optional[Tuple[ChartIndex, Dict[str, Dict[str, str]], bool]]: The index, the category names
+            and whether a source was touched without changing (so the stored mtimes should be
+            refreshed), or None if there is no usable cache.
+    """
+    try:
+        with open(cache_file, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            (magic, version, layout, song_mtime, song_size, song_hash,
+             category_mtime, category_size, category_hash, level_slots) = _HEADER.unpack_from(mapped, 0)
+            if magic != CACHE_MAGIC or version != CACHE_VERSION or layout.rstrip(b"\0") != CACHE_LAYOUT:
+                return None
+            source_states = (_source_state(song_file, song_mtime, song_size, song_hash),
+                             _source_state(category_file, category_mtime, category_size, category_hash))
+            if None in source_states:
+                return None
+            lengths = _SECTION_LENGTHS.unpack_from(mapped, _HEADER.size)
+            offset = _HEADER.size + _SECTION_LENGTHS.size
+            if offset + sum(lengths) != len(mapped):
+                return None  # Truncated or corrupted
+
+            index = ChartIndex()
+            view = memoryview(mapped)
+            try:
+                for (name, typecode), length in zip(_ARRAY_SECTIONS, lengths):
+                    values = array(typecode)
+                    values.frombytes(view[offset:offset + length])
+                    setattr(index, name, values)
+                    offset += length
+                texts = []
+                for length in lengths[len(_ARRAY_SECTIONS):]:
+                    text = bytes(view[offset:offset + length]).decode("utf-8")
+                    texts.append(text.split(_SEPARATOR) if text else [])
+                    offset += length
+            finally:
+                view.release()
+    except (OSError, ValueError, struct.error):  # Missing, unreadable or damaged: fall back to the CSVs
+        return None
+
+    titles, category_names, category_rows = texts
+    index.titles = titles
+    index.category_names = category_names
+    index.category_ids = {name: category_id for category_id, name in enumerate(category_names)}
+    index.level_slots = level_slots
+    full_category_names = {category_rows[i]: {'full_name': category_rows[i + 1], 'source': category_rows[i + 2]}
+                           for i in range(0, len(category_rows), 3)}
+    return index, full_category_names, "touched" in source_states
+
+
+def load_song_database(song_file=SONG_LIST_FILE, category_file=CATEGORY_NAMES_FILE,
+                       cache_file: Optional[str] = None) -> SongDatabase:
+    """
+    Loads the chart index and category names, from the compiled cache when it is up to date.
+    Otherwise the CSVs are parsed and the cache is rebuilt. The index is also registered so that
+    load_chart_index(song_file) returns it.
+
+    Args:
+        song_file (str): The path to the song list CSV.
+        category_file (str): The path to the category names CSV.
+        cache_file (Optional[str]): The cache path; defaults to default_cache_file(song_file).
+
+    Returns:
+        SongDatabase: The loaded data, the load time and whether the cache was used.
+
+    Raises:
+        FileNotFoundError: If the song list CSV does not exist.
+    """
+    started = time.perf_counter()
+    if cache_file is None:
+        cache_file = default_cache_file(song_file)
+    cached = read_cache(cache_file, song_file, category_file)
+    if cached:
+        index, full_category_names, touched = cached
+    else:
+        index = ChartIndex.from_csv(song_file)
+        index.build_buckets()
+        full_category_names = load_full_category_names(category_file)
+        touched = True
+    if touched:
+        try:
+            write_cache(cache_file, song_file, category_file, index, full_category_names)
+        except OSError as e:
+            # stderr, so that it does not end up in the --json output of randomizer_cli.py
+            print(f"Could not write the song cache '{cache_file}': {e}", file=sys.stderr)
+    set_chart_index(song_file, index)
+    load_seconds = time.perf_counter() - started
+    if METRICS.enabled:
+        METRICS.record("load", load_seconds)
+    return SongDatabase(index, full_category_names, load_seconds, bool(cached))
@@ -0,0 +1,179 @@
+"""
+Command-line entry point for the DJMAX RESPECT randomizer.
+
+Takes the same filters as the GUI and prints the drawn charts, one per line. Only the headless
+core is imported, so it starts quickly enough to be called from chat bots and scripts.
+
+Example:
+    python randomizer_cli.py --categories RP VE --key-mode 6B --nm-hd-mx-level 8 12 --no-sc --count 3
+    python randomizer_cli.py --draft 8-9,10-11,12-13,14-15 --setlists 16 --key-mode 6B
+"""
+import time
+started = time.perf_counter()
+
+import argparse
+import json
+import random
+import sys
+from randomizer_core import (SONG_LIST_FILE, CATEGORY_NAMES_FILE, KEY_MODES, FAIRNESS_MODES, ChartFilter, Fairness,
+                             parse_category_weights, parse_difficulty_levels, format_history_entry)
+from randomizer_cache import load_song_database
+from randomizer_metrics import METRICS
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """Builds the argument parser; the options mirror the GUI filters."""
+    parser = argparse.ArgumentParser(description="Draw random DJMAX RESPECT V charts.")
+    parser.add_argument("--songs", default=SONG_LIST_FILE, help="Path to the song list CSV.")
+    parser.add_argument("--category-names", default=CATEGORY_NAMES_FILE, help="Path to the category names CSV.")
+    parser.add_argument("--categories", nargs="+", default=["All"], metavar="CATEGORY",
+                        help='Short category names to draw from, e.g. "RP VE". Default: All.')
+    parser.add_argument("--key-mode", nargs="+", default=["All"], choices=["All"] + KEY_MODES, metavar="KEY_MODE",
+                        help='Key modes to draw from, e.g. "4B 6B". Default: All.')
+    parser.add_argument("--no-nm-hd-mx", action="store_true", help="Exclude NM, HD and MX charts.")
+    parser.add_argument("--no-sc", action="store_true", help="Exclude SC charts.")
+    parser.add_argument("--nm-hd-mx-level", nargs=2, type=int, default=[1, 15], metavar=("MIN", "MAX"),
+                        help="Level range for NM, HD and MX charts. Default: 1 15.")
+    parser.add_argument("--sc-level", nargs=2, type=int, default=[1, 15], metavar=("MIN", "MAX"),
+                        help="Level range for SC charts. Default: 1 15.")
+    parser.add_argument("--difficulties", metavar="LEVELS",
+                        help='Individual difficulties with their own level ranges, e.g. "NM=1-5,MX=10-13,SC". '
+                             'Replaces --no-nm-hd-mx, --no-sc, --nm-hd-mx-level and --sc-level.')
+    parser.add_argument("--count", type=int, default=1, help="Number of charts to draw per setlist. Default: 1.")
+    parser.add_argument("--setlists", type=int, default=1, help="Number of setlists to draw. Default: 1.")
+    parser.add_argument("--unique-songs", action="store_true",
+                        help="Never draw the same song twice within a setlist.")
+    parser.add_argument("--fairness", default="chart", choices=FAIRNESS_MODES,
+                        help="Give every matching chart, song or category an equal chance, or weight the "
+                             "categories with --category-weights (custom). Default: chart.")
+    parser.add_argument("--category-weights", default="", metavar="WEIGHTS",
+                        help='Weights for --fairness custom, e.g. "RP=2,VE=0.5". Unlisted categories weigh 1.')
+    parser.add_argument("--draft", metavar="CURVE",
+                        help='Draft --setlists setlists for a tournament, one round per level range of CURVE '
+                             '(e.g. "8-9,10-11,12-13,14-15"; it replaces the level options and --count). No song '
+                             'is used twice in the whole draft and the categories are balanced.')
+    parser.add_argument("--processes", type=int, default=1, metavar="N",
+                        help="Worker processes for --draft; only worth it for thousands of slots. Default: 1.")
+    parser.add_argument("--no-repeat-draws", type=int, default=0, metavar="N",
+                        help="Skip charts drawn in the last N draws of the history (and of this run).")
+    parser.add_argument("--no-repeat-minutes", type=float, default=0, metavar="T",
+                        help="Skip charts drawn in the last T minutes of the history (and of this run).")
+    parser.add_argument("--seed", type=int, help="Seed for reproducible draws.")
+    parser.add_argument("--json", action="store_true", help="Print each draw as a JSON object.")
+    parser.add_argument("--save-history", action="store_true", help="Append the draws to the history file.")
+    parser.add_argument("--timing", action="store_true", help="Report the startup time on stderr.")
+    parser.add_argument("--metrics", metavar="FILE",
+                        help="Record per-stage timings and write them to FILE (CSV if it ends in .csv, else JSON).")
+    return parser
+
+
+def filter_from_args(args) -> ChartFilter:
+    """
+    Converts parsed command-line arguments into a ChartFilter.
+
+    Raises:
+        ValueError: If --difficulties cannot be parsed.
+    """
+    return ChartFilter(tuple(args.categories), ",".join(args.key_mode), not args.no_nm_hd_mx, not args.no_sc,
+                       args.nm_hd_mx_level[0], args.nm_hd_mx_level[1], args.sc_level[0], args.sc_level[1],
+                       parse_difficulty_levels(args.difficulties or ""))
+
+
+def main(argv=None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.count < 1:
+        parser.error("--count must be at least 1")
+    if args.setlists < 1:
+        parser.error("--setlists must be at least 1")
+    no_repeat = args.no_repeat_draws > 0 or args.no_repeat_minutes > 0
+    if no_repeat and args.unique_songs:
+        parser.error("--unique-songs cannot be combined with --no-repeat-draws or --no-repeat-minutes")
+    if no_repeat and args.draft:
+        parser.error("--draft cannot be combined with --no-repeat-draws or --no-repeat-minutes")
+    curve = None
+    if args.draft:
+        from randomizer_draft import parse_level_curve, draft_rounds  # Only needed for drafts
+        try:
+            curve = parse_level_curve(args.draft)
+        except ValueError as e:
+            parser.error(str(e))
+        args.count = len(curve)
+    try:
+        fairness = Fairness(args.fairness, parse_category_weights(args.category_weights))
+        chart_filter = filter_from_args(args)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.metrics:
+        METRICS.enable()
+    try:
+        song_database = load_song_database(args.songs, args.category_names)
+    except FileNotFoundError:
+        print(f"Error: CSV file '{args.songs}' not found.", file=sys.stderr)
+        return 2
+    index = song_database.index
+    if args.timing:
+        print(f"Startup: {(time.perf_counter() - started) * 1000:.1f} ms (song list: {len(index)} charts in "
+              f"{song_database.load_seconds * 1000:.1f} ms{' from cache' if song_database.from_cache else ', cache rebuilt'})",
+              file=sys.stderr)
+
+    rng = random.Random(args.seed)
+    if curve is not None:
+        with METRICS.stage("draw"):
+            result = draft_rounds(index, chart_filter, args.setlists, curve, rng, processes=args.processes)
+        if result.unfilled:
+            print(f"{result.unfilled} slots could not be filled: too few different songs match the draft.",
+                  file=sys.stderr)
+        setlists = [[chart for chart in setlist if chart is not None] for setlist in result.setlists]
+    elif no_repeat:
+        from randomizer_history import HistoryStore, load_recent_draws  # sqlite3 is only imported when it is needed
+        history_store = HistoryStore()
+        recent = load_recent_draws(history_store, args.no_repeat_draws, args.no_repeat_minutes * 60)
+        history_store.close()
+        setlists = []
+        for _ in range(args.setlists):
+            setlist = []
+            for _ in range(args.count):
+                with METRICS.stage("draw"):
+                    chart = index.draw(chart_filter, rng, recent, fairness)
+                if chart is None:
+                    break
+                setlist.append(chart)
+                recent.add(index.chart_tuple(chart))
+            setlists.append(setlist)
+    else:
+        with METRICS.stage("draw"):
+            setlists = index.draw_setlists(chart_filter, args.setlists, args.count, rng, args.unique_songs, fairness)
+    if not any(setlists):
+        print("No songs found with the selected criteria.", file=sys.stderr)
+        return 1
+
+    drawn = []
+    for number, setlist in enumerate(setlists, start=1):
+        if len(setlist) < args.count and curve is None:
+            print(f"Setlist {number}: only {len(setlist)} different songs match the selected criteria.",
+                  file=sys.stderr)
+        if number > 1 and not args.json:
+            print()  # Blank line between setlists
+        for chart in setlist:
+            song_data = index.chart_tuple(chart)
+            drawn.append(song_data)
+            if args.json:
+                title, difficulty, level, category = song_data
+                print(json.dumps({"setlist": number, "title": title, "difficulty": difficulty,
+                                  "level": int(level), "category": category}, ensure_ascii=False))
+            else:
+                print(format_history_entry(song_data))
+    if args.save_history:
+        from randomizer_history import HistoryStore  # sqlite3 is only imported when it is needed
+        with METRICS.stage("history"):
+            history_store = HistoryStore()
+            history_store.append_many(drawn)  # One transaction for the whole batch
+            history_store.close()
+    if args.metrics:
+        METRICS.dump(args.metrics)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,1166 @@
+"""
+Headless core of the DJMAX RESPECT randomizer: song list loading, filtering, drawing and history.
+
+This module does not import tkinter, so it can be used from scripts, bots and the command line
+(see randomizer_cli.py) without a display.
+"""
+import csv
+import os
+import random
+import time
+from collections import OrderedDict, deque
+from typing import List, Dict, Tuple, NamedTuple, Optional, Iterator
+from array import array
+from randomizer_metrics import METRICS
+
+SONG_LIST_FILE = "SongList.csv"
+CATEGORY_NAMES_FILE = "CategoryNames.csv"
+HISTORY_FILE = "history.txt"  # Legacy text history, imported into the history store on first start
+
+KEY_MODES = ["4B", "5B", "6B", "8B"]
+DIFFICULTIES = ["NM", "HD", "MX", "SC"]
+DIFFICULTY_COLORS = {"SC": "#ff00ff", "MX": "#ff0000", "HD": "#ff8200", "NM": "#ffd966"}  # GUI and overlay
+REPEAT_ATTEMPTS = 16  # Random picks tried before the no-repeat mode looks at the whole pool
+# Sampling fairness: equal chance per matching chart, per song, per category, or per category with custom weights
+FAIRNESS_MODES = ["chart", "song", "category", "custom"]
+FILTER_CACHE_SIZE = 32  # Filters whose matching bucket slices and samplers each chart index keeps
+
+
+class ChartFilter(NamedTuple):
+    """
+    The filter criteria shared by get_songs_by_categories, the chart index and the GUI.
+
+    If difficulty_levels is given, it selects the difficulties and their level ranges instead of
+    the NM/HD/MX and SC fields, e.g. (("MX", 10, 13), ("SC", 8, 12)) for MX 10-13 and SC 8-12.
+    """
+    selected_categories: Tuple[str, ...]  # "All" disables the category filter
+    key_mode_filter: str  # "4B", "5B", "6B", "8B" or several joined with commas ("4B,6B"); "All" or "" for every key mode
+    include_nm_hd_mx: bool
+    include_sc: bool
+    nm_hd_mx_min_level: int
+    nm_hd_mx_max_level: int
+    sc_min_level: int
+    sc_max_level: int
+    difficulty_levels: Tuple[Tuple[str, int, int], ...] = ()  # (difficulty, min level, max level), one per difficulty
+
+
+def parse_key_modes(key_mode_filter: str) -> Tuple[str, ...]:
+    """
+    Returns the key modes selected by a key mode filter such as "6B", "4B,6B" or "All", in
+    KEY_MODES order. Unknown names are ignored, so "9B" selects nothing.
+    """
+    names = set(key_mode_filter.replace(",", " ").split()) if key_mode_filter else {"All"}
+    if "All" in names:
+        return tuple(KEY_MODES)
+    return tuple(key_mode for key_mode in KEY_MODES if key_mode in names)
+
+
+def filter_difficulty_levels(chart_filter: ChartFilter) -> Tuple[Tuple[str, int, int], ...]:
+    """
+    Returns the difficulties a filter includes with their level ranges, in DIFFICULTIES order.
+    Difficulties with an empty level range are left out; if difficulty_levels names a difficulty
+    twice, the last range counts.
+    """
+    if chart_filter.difficulty_levels:
+        levels = {difficulty.upper(): (min_level, max_level)
+                  for difficulty, min_level, max_level in chart_filter.difficulty_levels}
+    else:
+        levels = {}
+        for diff in DIFFICULTIES:
+            if diff == "SC":
+                if chart_filter.include_sc:
+                    levels[diff] = (chart_filter.sc_min_level, chart_filter.sc_max_level)
+            elif chart_filter.include_nm_hd_mx:
+                levels[diff] = (chart_filter.nm_hd_mx_min_level, chart_filter.nm_hd_mx_max_level)
+    return tuple((diff, *levels[diff]) for diff in DIFFICULTIES if diff in levels and levels[diff][0] <= levels[diff][1])
+
+
+def filter_mask(chart_filter: ChartFilter) -> int:
+    """
+    Returns the (key mode, difficulty) cells a filter selects as a bitmask. The bit of a cell is
+    key mode id * len(DIFFICULTIES) + difficulty id, the order of the cells in the chart index
+    buckets, so any combination of key modes and difficulties is one mask.
+    """
+    diff_ids = [DIFFICULTIES.index(diff) for diff, _, _ in filter_difficulty_levels(chart_filter)]
+    mask = 0
+    for key_mode in parse_key_modes(chart_filter.key_mode_filter):
+        for diff_id in diff_ids:
+            mask |= 1 << (KEY_MODES.index(key_mode) * len(DIFFICULTIES) + diff_id)
+    return mask
+
+
+def parse_difficulty_levels(text: str) -> Tuple[Tuple[str, int, int], ...]:
+    """
+    Parses individual difficulties and their level ranges written as "NM=1-5, MX=10-13, SC"
+    (commas or spaces between entries; a difficulty without a range includes every level).
+
+    Args:
+        text (str): The difficulties.
+
+    Returns:
+        Tuple[Tuple[str, int, int], ...]: (difficulty, min level, max level) triples, as used by
+            ChartFilter.difficulty_levels.
+
+    Raises:
+        ValueError: If an entry is not a difficulty, optionally followed by =LEVEL or =MIN-MAX.
+    """
+    levels = []
+    for item in text.replace(",", " ").split():
+        diff, separator, level_range = item.partition("=")
+        low, dash, high = level_range.partition("-")
+        try:
+            if diff.upper() not in DIFFICULTIES:
+                raise ValueError
+            if not separator:
+                levels.append((diff.upper(), 1, 15))
+            else:
+                levels.append((diff.upper(), int(low), int(high) if dash else int(low)))
+        except ValueError:
+            raise ValueError(f"Invalid difficulty '{item}', expected one of {', '.join(DIFFICULTIES)} "
+                             f"optionally followed by =LEVEL or =MIN-MAX") from None
+    return tuple(levels)
+
+
+def normalize_filter(chart_filter: ChartFilter) -> ChartFilter:
+    """
+    Returns a canonical form of a filter, so that filters matching the same charts compare equal:
+    the categories are sorted and deduplicated (just "All" if it is selected), the key modes are
+    listed in KEY_MODES order ("All" if all of them are selected) and the difficulties are always
+    given as difficulty_levels, with the NM/HD/MX and SC fields cleared.
+    """
+    if "All" in chart_filter.selected_categories:
+        categories = ("All",)
+    else:
+        categories = tuple(sorted(set(chart_filter.selected_categories)))
+    key_modes = parse_key_modes(chart_filter.key_mode_filter)
+    if len(key_modes) == len(KEY_MODES):
+        key_mode_filter = "All"
+    else:
+        key_mode_filter = ",".join(key_modes) or chart_filter.key_mode_filter  # Unknown key modes match nothing
+    return ChartFilter(categories, key_mode_filter, False, False, 0, 0, 0, 0, filter_difficulty_levels(chart_filter))
+
+
+class LRUCache:
+    """
+    A mapping that holds at most capacity items and evicts the least recently used one first.
+    Counts hits, misses and evictions so the capacity can be sized from real use.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Returns the item for key (marking it as recently used), or None."""
+        value = self._items.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self._items.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self._items[key] = value
+        self._items.move_to_end(key)
+        while len(self._items) > max(self.capacity, 0):
+            self._items.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        """Removes every item; the counters are kept."""
+        self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+    def stats(self) -> Dict[str, float]:
+        """Returns the size, capacity, hits, misses, evictions and hit rate."""
+        lookups = self.hits + self.misses
+        return {"size": len(self._items), "capacity": self.capacity, "hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions, "hit_rate": self.hits / lookups if lookups else 0.0}
+
+
+class _FilterResult:
+    """
+    The cached result of one normalized filter: its bucket slices, its number of songs once counted
+    and a sampler per fairness.
+    """
+    __slots__ = ("ranges", "song_count", "samplers")
+
+    def __init__(self, ranges: List[Tuple[int, int]]):
+        self.ranges = ranges
+        self.song_count: Optional[int] = None  # See ChartIndex.count_songs
+        self.samplers: Dict['Fairness', Optional['ChartSampler']] = {}
+
+
+class Fairness(NamedTuple):
+    """
+    How draws are weighted among the matching charts.
+    """
+    mode: str = "chart"  # One of FAIRNESS_MODES
+    category_weights: Tuple[Tuple[str, float], ...] = ()  # (category, weight) pairs for "custom"; default 1
+
+
+def parse_category_weights(text: str) -> Tuple[Tuple[str, float], ...]:
+    """
+    Parses custom category weights written as "RP=2, VE=0.5" (commas or spaces between entries).
+
+    Args:
+        text (str): The weights.
+
+    Returns:
+        Tuple[Tuple[str, float], ...]: Sorted (category, weight) pairs, as used by Fairness.
+
+    Raises:
+        ValueError: If an entry is not of the form CATEGORY=NUMBER or a weight is negative.
+    """
+    weights = {}
+    for item in text.replace(",", " ").split():
+        category, separator, weight = item.partition("=")
+        try:
+            if not separator or not category:
+                raise ValueError
+            weights[category] = float(weight)
+        except ValueError:
+            raise ValueError(f"Invalid category weight '{item}', expected CATEGORY=NUMBER") from None
+        if weights[category] < 0:
+            raise ValueError(f"Category weight '{item}' is negative")
+    return tuple(sorted(weights.items()))
+
+
+class AliasTable:
+    """
+    Walker's alias table (Vose's construction): built in O(n) from n weights, after which each
+    weighted draw costs one randrange and one random() call.
+    """
+
+    def __init__(self, weights: List[float]):
+        """
+        Args:
+            weights (List[float]): Positive weights; at least one.
+        """
+        count = len(weights)
+        total = sum(weights)
+        scaled = array('d', (weight * count / total for weight in weights))
+        self.probability = array('d', [1.0]) * count
+        self.alias = array('I', range(count))
+        small = array('I', (item for item, weight in enumerate(scaled) if weight < 1.0))
+        large = array('I', (item for item, weight in enumerate(scaled) if weight >= 1.0))
+        while small and large:
+            less, more = small.pop(), large.pop()
+            self.probability[less] = scaled[less]
+            self.alias[less] = more
+            scaled[more] += scaled[less] - 1.0
+            (small if scaled[more] < 1.0 else large).append(more)
+        # Whatever is left is 1.0 up to rounding error and keeps its default probability
+
+    def __len__(self):
+        return len(self.probability)
+
+    def sample(self, rng) -> int:
+        """Returns an item index with probability proportional to its weight."""
+        item = rng.randrange(len(self.probability))
+        return item if rng.random() < self.probability[item] else self.alias[item]
+
+
+class ChartSampler:
+    """
+    Draws matching charts in O(1) for one filter and fairness: an alias table picks a slice of the
+    chart index's bucket_charts, then a uniform position inside it.
+    """
+
+    def __init__(self, bucket_charts: array, starts: array, sizes: Optional[array], weights: List[float]):
+        """
+        Args:
+            bucket_charts (array): The chart index's bucket_charts.
+            starts (array): The first position of each slice.
+            sizes (Optional[array]): The length of each slice; None when every slice is a single chart.
+            weights (List[float]): The positive weight of each slice.
+        """
+        self.bucket_charts = bucket_charts
+        self.starts = starts
+        self.sizes = sizes
+        self.table = AliasTable(weights)
+
+    def pick(self, rng) -> int:
+        item = self.table.sample(rng)
+        if self.sizes is None:
+            return self.bucket_charts[self.starts[item]]
+        return self.bucket_charts[self.starts[item] + rng.randrange(self.sizes[item])]
+
+
+def chart_key(song_data: Tuple[str, str, str, str]) -> Tuple[str, str, str]:
+    """
+    Returns the identity of a chart in a (title, difficulty, level, category) tuple or history entry:
+    its title, difficulty and category (the level may change with song list updates).
+    """
+    return song_data[0], song_data[1], song_data[3].strip()
+
+
+class RecentDraws:
+    """
+    The window of the no-repeat mode: charts drawn within the last max_draws draws and/or the
+    last max_age seconds. With both limits a draw stays in the window until it is outside both,
+    so setting a second limit never lets a chart repeat sooner.
+
+    Draws are kept oldest first in a ring buffer next to a count per chart key, so recording a draw
+    and checking whether a chart is recent are both O(1) (expiry is amortized over the additions).
+    """
+
+    def __init__(self, max_draws: int = 0, max_age: float = 0):
+        """
+        Args:
+            max_draws (int): Exclude charts drawn in the last max_draws draws; 0 disables the limit.
+            max_age (float): Exclude charts drawn in the last max_age seconds; 0 disables the limit.
+        """
+        self.max_draws = max_draws
+        self.max_age = max_age
+        self._ring = deque()  # (chart key, drawn at), oldest first
+        self._counts: Dict[Tuple[str, str, str], int] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.max_draws or self.max_age)
+
+    def add(self, song_data: Tuple[str, str, str, str], drawn_at: Optional[float] = None):
+        """
+        Records a drawn chart.
+
+        Args:
+            song_data (Tuple[str, str, str, str]): The drawn song tuple or history entry.
+            drawn_at (Optional[float]): The draw time; defaults to now.
+        """
+        if not self.enabled:
+            return
+        key = chart_key(song_data)
+        self._ring.append((key, time.time() if drawn_at is None else drawn_at))
+        self._counts[key] = self._counts.get(key, 0) + 1
+        self._expire()
+
+    def seed(self, entries):
+        """
+        Fills the window from history entries, oldest first.
+
+        Args:
+            entries (Iterable[HistoryEntry]): The entries, oldest first.
+        """
+        for entry in entries:
+            self.add(entry, entry.drawn_at)
+
+    def _pop_oldest(self):
+        key, _ = self._ring.popleft()
+        if self._counts[key] == 1:
+            del self._counts[key]
+        else:
+            self._counts[key] -= 1
+
+    def _expire(self):
+        """Drops the oldest draws that are outside every limit that is set."""
+        oldest_allowed = time.time() - self.max_age if self.max_age else None
+        while self._ring:
+            beyond_draws = not self.max_draws or len(self._ring) > self.max_draws
+            beyond_age = oldest_allowed is None or self._ring[0][1] < oldest_allowed
+            if not (beyond_draws and beyond_age):
+                break
+            self._pop_oldest()
+
+    def __contains__(self, key: Tuple[str, str, str]) -> bool:
+        self._expire()
+        return key in self._counts
+
+    def __len__(self):
+        self._expire()
+        return len(self._ring)
+
+    def oldest_first(self) -> Iterator[Tuple[str, str, str]]:
+        """Yields the chart keys in the window, least recently drawn first."""
+        self._expire()
+        return (key for key, _ in self._ring)
+
+    def clear(self):
+        self._ring.clear()
+        self._counts.clear()
+
+
+class SongListChanges(NamedTuple):
+    """What ChartIndex.apply_song_list changed."""
+    added: int  # Songs
+    removed: int
+    changed: int  # Songs whose charts or levels changed
+    rebuilt: bool  # True if the whole index had to be rebuilt
+
+
+def _song_key(songs: dict, title: str, category: str) -> Tuple[str, str, int]:
+    """Returns the next free (title, category, occurrence) key, so that duplicate rows stay apart."""
+    occurrence = 0
+    while (title, category, occurrence) in songs:
+        occurrence += 1
+    return title, category, occurrence
+
+
+class ChartIndex:
+    """
+    In-memory columnar index of every chart in the song list.
+
+    The CSV is parsed once; each playable chart (a song in one key mode and difficulty) becomes one
+    position in a set of compact parallel arrays holding its song id, category id, key mode,
+    difficulty and level. Filters run against these arrays and never touch the disk.
+    """
+
+    def __init__(self):
+        self.titles: List[str] = []  # song id -> title
+        self.song_category = array('H')  # song id -> category id
+        self.category_names: List[str] = []  # category id -> short category name
+        self.category_ids: Dict[str, int] = {}  # short category name -> category id
+        self.chart_song = array('I')
+        self.chart_category = array('H')
+        self.chart_key_mode = array('B')  # index into KEY_MODES
+        self.chart_difficulty = array('B')  # index into DIFFICULTIES
+        self.chart_level = array('B')
+        # Charts grouped by (category, key mode, difficulty, level) bucket; see build_buckets
+        self.level_slots = 0
+        self.bucket_offsets: Optional[array] = None
+        self.bucket_charts: Optional[array] = None
+        # Normalized filter -> _FilterResult of the most recently used filters
+        self.filter_cache = LRUCache(FILTER_CACHE_SIZE)
+        self._songs = None  # Song key -> (song id, levels, chart ids) of the live songs; see song_table
+
+    @classmethod
+    def from_csv(cls, csv_file) -> 'ChartIndex':
+        """
+        Builds the index from a song list CSV.
+
+        Args:
+            csv_file (str): The path to the CSV file.
+
+        Returns:
+            ChartIndex: The populated index.
+        """
+        index = cls()
+        for title, category, levels in read_song_list(csv_file):
+            index.add_song(title, category, levels)
+        return index
+
+    def add_song(self, title: str, category: str, levels: List[Tuple[int, int, int]]) -> int:
+        """
+        Appends a song and its charts to the index.
+
+        Args:
+            title (str): The song title.
+            category (str): The short category name.
+            levels (List[Tuple[int, int, int]]): (key mode id, difficulty id, level) for each chart.
+
+        Returns:
+            int: The new song id.
+        """
+        category_id = self.category_ids.get(category)
+        if category_id is None:
+            category_id = len(self.category_names)
+            self.category_ids[category] = category_id
+            self.category_names.append(category)
+        song_id = len(self.titles)
+        self.titles.append(title)
+        self.song_category.append(category_id)
+        for key_mode_id, diff_id, level in levels:
+            self.chart_song.append(song_id)
+            self.chart_category.append(category_id)
+            self.chart_key_mode.append(key_mode_id)
+            self.chart_difficulty.append(diff_id)
+            self.chart_level.append(level)
+        self.bucket_offsets = None  # Buckets are rebuilt on the next query
+        self.filter_cache.clear()
+        self._songs = None
+        return song_id
+
+    def __len__(self):
+        # Charts replaced by apply_song_list stay in the chart arrays but are no longer in any bucket
+        return len(self.chart_level) if self.bucket_charts is None else len(self.bucket_charts)
+
+    def build_buckets(self):
+        """
+        Sorts the chart ids into (category, key mode, difficulty, level) buckets with a counting sort.
+
+        Buckets are laid out so that bucket_offsets is a prefix sum over bucket sizes, and all levels
+        of one (category, key mode, difficulty) cell are adjacent. The charts of any level range in a
+        cell are therefore the single slice bucket_charts[offsets[lo]:offsets[hi + 1]].
+        """
+        self.level_slots = max(self.chart_level, default=0) + 1
+        num_buckets = len(self.category_names) * len(KEY_MODES) * len(DIFFICULTIES) * self.level_slots
+        # Arrays rather than lists keep this compact for song lists with millions of charts
+        bucket_of_chart = array('I', (self._bucket(category_id, key_mode_id, diff_id, level)
+                                      for category_id, key_mode_id, diff_id, level in
+                                      zip(self.chart_category, self.chart_key_mode, self.chart_difficulty,
+                                          self.chart_level)))
+        counts = array('I', [0]) * num_buckets
+        for bucket in bucket_of_chart:
+            counts[bucket] += 1
+        offsets = array('I', [0]) * (num_buckets + 1)
+        for bucket in range(num_buckets):
+            offsets[bucket + 1] = offsets[bucket] + counts[bucket]
+        charts = array('I', [0]) * len(bucket_of_chart)
+        fill = offsets[:-1]
+        for chart, bucket in enumerate(bucket_of_chart):  # Stable: song list order inside a bucket
+            charts[fill[bucket]] = chart
+            fill[bucket] += 1
+        self.bucket_offsets = offsets
+        self.bucket_charts = charts
+        self.filter_cache.clear()
+        self._songs = None
+
+    def song_table(self) -> Dict[Tuple[str, str, int], Tuple[int, Tuple[Tuple[int, int, int], ...], List[int]]]:
+        """
+        Returns the live songs keyed by (title, category, occurrence) with their song id, their
+        (key mode id, difficulty id, level) tuples and their chart ids. Built from the buckets once
+        and then kept up to date by apply_song_list.
+
+        Building it walks every chart, so an app that applies song lists on a UI thread should call
+        this first where the wait does not matter (e.g. on the thread that reads the new CSV); it only
+        reads the index. apply_song_list then only diffs the songs and splices the changed buckets.
+        """
+        if self._songs is None:
+            if self.bucket_offsets is None:
+                self.build_buckets()
+            charts_by_song: Dict[int, List[int]] = {}
+            for chart in sorted(self.bucket_charts):
+                charts_by_song.setdefault(self.chart_song[chart], []).append(chart)
+            songs = {}
+            for song_id in sorted(charts_by_song):
+                charts = charts_by_song[song_id]
+                key = _song_key(songs, self.titles[song_id], self.category_names[self.song_category[song_id]])
+                songs[key] = (song_id, tuple((self.chart_key_mode[chart], self.chart_difficulty[chart],
+                                              self.chart_level[chart]) for chart in charts), charts)
+            self._songs = songs
+        return self._songs
+
+    def apply_song_list(self, songs: List[Tuple[str, str, List[Tuple[int, int, int]]]]) -> 'SongListChanges':
+        """
+        Updates the index in place to a new version of the song list, touching only the songs that
+        were added, removed or whose charts changed. Unchanged songs keep their song and chart ids.
+
+        Charts of removed and changed songs stay in the chart arrays but are taken out of their
+        buckets; the charts of changed and added songs are appended and put into their buckets.
+        bucket_charts is rebuilt from slices, so only the changed buckets are walked in Python.
+        The index is rebuilt from scratch instead when a new level exceeds the bucket layout or
+        too many replaced charts have piled up.
+
+        Args:
+            songs (List[Tuple[str, str, List[Tuple[int, int, int]]]]): The new song list, as returned
+                by read_song_list.
+
+        Returns:
+            SongListChanges: The number of added, removed and changed songs.
+        """
+        current = self.song_table()
+        new_songs = {}
+        for title, category, levels in songs:
+            new_songs[_song_key(new_songs, title, category)] = tuple(levels)
+        removed = [key for key in current if key not in new_songs]
+        changed = [key for key, levels in new_songs.items() if key in current and current[key][1] != levels]
+        added = [key for key in new_songs if key not in current]
+        if not (removed or changed or added):
+            return SongListChanges(0, 0, 0, False)
+
+        dead_charts = {chart for key in removed + changed for chart in current[key][2]}
+        new_charts = sum(len(new_songs[key]) for key in changed + added)
+        dead_total = len(self.chart_level) - len(self.bucket_charts) + len(dead_charts)
+        too_high = any(level >= self.level_slots for key in changed + added for _, _, level in new_songs[key])
+        if too_high or dead_total > (len(self.chart_level) + new_charts) // 2:
+            rebuilt = ChartIndex()
+            for title, category, levels in songs:
+                rebuilt.add_song(title, category, levels)
+            rebuilt.build_buckets()
+            rebuilt.filter_cache = self.filter_cache
+            rebuilt.filter_cache.clear()
+            self.__dict__.update(rebuilt.__dict__)  # Keep this object, which the GUI and server hold on to
+            return SongListChanges(len(added), len(removed), len(changed), True)
+
+        # New categories get their buckets after all existing ones, so the existing offsets stay valid
+        buckets_per_category = len(KEY_MODES) * len(DIFFICULTIES) * self.level_slots
+        for _, category, _ in added:
+            if category not in self.category_ids:
+                self.category_ids[category] = len(self.category_names)
+                self.category_names.append(category)
+                self.bucket_offsets.extend([self.bucket_offsets[-1]] * buckets_per_category)
+
+        # bucket -> (charts leaving it, charts entering it)
+        bucket_changes: Dict[int, Tuple[set, List[int]]] = {}
+        for chart in dead_charts:
+            bucket = self._bucket(self.chart_category[chart], self.chart_key_mode[chart],
+                                  self.chart_difficulty[chart], self.chart_level[chart])
+            bucket_changes.setdefault(bucket, (set(), []))[0].add(chart)
+        for key in removed:
+            del current[key]
+        for key in changed + added:
+            title, category, _ = key
+            category_id = self.category_ids[category]
+            if key in current:
+                song_id = current[key][0]
+            else:
+                song_id = len(self.titles)
+                self.titles.append(title)
+                self.song_category.append(category_id)
+            charts = []
+            for key_mode_id, diff_id, level in new_songs[key]:
+                chart = len(self.chart_level)
+                self.chart_song.append(song_id)
+                self.chart_category.append(category_id)
+                self.chart_key_mode.append(key_mode_id)
+                self.chart_difficulty.append(diff_id)
+                self.chart_level.append(level)
+                charts.append(chart)
+                bucket_changes.setdefault(self._bucket(category_id, key_mode_id, diff_id, level),
+                                          (set(), []))[1].append(chart)
+            current[key] = (song_id, new_songs[key], charts)
+
+        old_charts, offsets = self.bucket_charts, self.bucket_offsets
+        charts = array('I')
+        copied = 0
+        shifts = []  # (first bucket, change in size) in bucket order
+        for bucket in sorted(bucket_changes):
+            leaving, entering = bucket_changes[bucket]
+            start, end = offsets[bucket], offsets[bucket + 1]
+            charts.extend(old_charts[copied:start])
+            kept = [chart for chart in old_charts[start:end] if chart not in leaving] if leaving else old_charts[start:end]
+            charts.extend(kept)
+            charts.extend(entering)
+            copied = end
+            shifts.append((bucket, len(kept) + len(entering) - (end - start)))
+        charts.extend(old_charts[copied:])
+        shift = 0
+        for number, (bucket, size_change) in enumerate(shifts):
+            shift += size_change
+            next_bucket = shifts[number + 1][0] if number + 1 < len(shifts) else len(offsets) - 1
+            if shift:
+                for later in range(bucket + 1, next_bucket + 1):
+                    offsets[later] += shift
+        self.bucket_charts = charts
+        self.filter_cache.clear()
+        return SongListChanges(len(added), len(removed), len(changed), False)
+
+    def _bucket(self, category_id: int, key_mode_id: int, diff_id: int, level: int) -> int:
+        return ((category_id * len(KEY_MODES) + key_mode_id) * len(DIFFICULTIES) + diff_id) * self.level_slots + level
+
+    def chart_ranges(self, chart_filter: ChartFilter) -> List[Tuple[int, int]]:
+        """
+        Returns the non-empty (start, end) slices of bucket_charts that hold the matching charts.
+        The cost depends on the number of selected categories, not on the number of charts, and
+        recently used filters are answered from the filter cache.
+
+        Args:
+            chart_filter (ChartFilter): The filter criteria.
+
+        Returns:
+            List[Tuple[int, int]]: Half-open slices of bucket_charts. Do not modify the list.
+        """
+        return self._filter_result(chart_filter).ranges
+
+    def _filter_result(self, chart_filter: ChartFilter) -> _FilterResult:
+        if self.bucket_offsets is None:
+            self.build_buckets()
+        key = normalize_filter(chart_filter)
+        result = self.filter_cache.get(key)
+        if result is None:
+            result = _FilterResult(self._find_ranges(key))
+            self.filter_cache.put(key, result)
+        return result
+
+    def _find_ranges(self, chart_filter: ChartFilter) -> List[Tuple[int, int]]:
+        if "All" in chart_filter.selected_categories:
+            category_ids = range(len(self.category_names))
+        else:
+            category_ids = [self.category_ids[name] for name in chart_filter.selected_categories
+                            if name in self.category_ids]
+        # The selected (key mode, difficulty) cells and the level range of every difficulty
+        mask = filter_mask(chart_filter)
+        level_ranges = {DIFFICULTIES.index(diff): (min_level, max_level)
+                        for diff, min_level, max_level in filter_difficulty_levels(chart_filter)}
+        cells = [divmod(cell, len(DIFFICULTIES)) for cell in range(len(KEY_MODES) * len(DIFFICULTIES))
+                 if mask >> cell & 1]
+
+        offsets = self.bucket_offsets
+        ranges = []
+        for category_id in category_ids:
+            for key_mode_id, diff_id in cells:
+                min_level, max_level = level_ranges[diff_id]
+                min_level = max(min_level, 0)
+                max_level = min(max_level, self.level_slots - 1)
+                if min_level > max_level:
+                    continue
+                start = offsets[self._bucket(category_id, key_mode_id, diff_id, min_level)]
+                end = offsets[self._bucket(category_id, key_mode_id, diff_id, max_level) + 1]
+                if start < end:
+                    ranges.append((start, end))
+        return ranges
+
+    def filter(self, chart_filter: ChartFilter) -> List[int]:
+        """
+        Returns the ids of the charts matching the given criteria, in song list order.
+
+        Args:
+            chart_filter (ChartFilter): The filter criteria.
+
+        Returns:
+            List[int]: The matching chart ids.
+        """
+        charts = []
+        for start, end in self.chart_ranges(chart_filter):
+            charts.extend(self.bucket_charts[start:end])
+        charts.sort()
+        return charts
+
+    def count(self, chart_filter: ChartFilter) -> int:
+        """Returns the number of charts matching the given criteria without listing them."""
+        return sum(end - start for start, end in self.chart_ranges(chart_filter))
+
+    def count_songs(self, chart_filter: ChartFilter) -> int:
+        """
+        Returns the number of different songs with at least one matching chart.
+
+        A song's charts can be spread over many buckets, so unlike count() this has to visit the
+        matching charts the first time a filter is counted (it still never lists them or touches the
+        CSV). The count is then kept with the filter's entry in the filter cache, so only filters
+        that are new or were evicted pay for it again.
+        """
+        result = self._filter_result(chart_filter)
+        if result.song_count is None:
+            chart_song = self.chart_song
+            songs = set()
+            for start, end in result.ranges:
+                songs.update(chart_song[chart] for chart in self.bucket_charts[start:end])
+            result.song_count = len(songs)
+        return result.song_count
+
+    def sampler(self, chart_filter: ChartFilter, fairness: Fairness = Fairness()) -> Optional[ChartSampler]:
+        """
+        Returns the sampler for a filter and fairness, or None if no chart matches. Samplers are
+        kept with the filter's entry in the filter cache, so the alias table is only built once per
+        recently used filter and fairness.
+
+        Per chart and per category weighting work on whole bucket slices (a slice's weight is its
+        size times the weight of one of its charts), so the candidate list is never built for them.
+        Per song weighting needs one weight per chart, 1 / (matching charts of its song).
+
+        Args:
+            chart_filter (ChartFilter): The filter criteria.
+            fairness (Fairness): How to weight the matching charts.
+
+        Returns:
+            Optional[ChartSampler]: The sampler.
+        """
+        result = self._filter_result(chart_filter)
+        if fairness in result.samplers:
+            return result.samplers[fairness]
+        with METRICS.stage("filter"):
+            sampler = self._build_sampler(result.ranges, fairness)
+        result.samplers[fairness] = sampler
+        return sampler
+
+    def _build_sampler(self, ranges: List[Tuple[int, int]], fairness: Fairness) -> Optional[ChartSampler]:
+        if fairness.mode == "song":
+            song_counts: Dict[int, int] = {}
+            chart_song = self.chart_song
+            for start, end in ranges:
+                for chart in self.bucket_charts[start:end]:
+                    song_counts[chart_song[chart]] = song_counts.get(chart_song[chart], 0) + 1
+            positions = array('I', (position for start, end in ranges for position in range(start, end)))
+            weights = array('d', (1.0 / song_counts[chart_song[self.bucket_charts[position]]]
+                                  for position in positions))
+            return ChartSampler(self.bucket_charts, positions, None, weights) if positions else None
+        if fairness.mode in ("category", "custom"):
+            range_categories = [self.chart_category[self.bucket_charts[start]] for start, _ in ranges]
+            category_counts: Dict[int, int] = {}
+            for (start, end), category_id in zip(ranges, range_categories):
+                category_counts[category_id] = category_counts.get(category_id, 0) + end - start
+            custom_weights = dict(fairness.category_weights) if fairness.mode == "custom" else {}
+            category_weight = {category_id: custom_weights.get(self.category_names[category_id], 1.0) / count
+                               for category_id, count in category_counts.items()}
+            slices = ranges
+            weights = [(end - start) * category_weight[category_id]
+                       for (start, end), category_id in zip(ranges, range_categories)]
+        elif fairness.mode == "chart":
+            slices = ranges
+            weights = [end - start for start, end in ranges]
+        else:
+            raise ValueError(f"Unknown fairness mode '{fairness.mode}'")
+
+        # Categories weighted 0 are left out entirely
+        weighted = [(chart_slice, weight) for chart_slice, weight in zip(slices, weights) if weight > 0]
+        if not weighted:
+            return None
+        return ChartSampler(self.bucket_charts, array('I', (start for (start, _), _ in weighted)),
+                            array('I', (end - start for (start, end), _ in weighted)),
+                            [weight for _, weight in weighted])
+
+    def draw(self, chart_filter: ChartFilter, rng=random, recent: Optional[RecentDraws] = None,
+             fairness: Fairness = Fairness()) -> Optional[int]:
+        """
+        Draws one matching chart at random, by default uniformly, without building the candidate list.
+
+        With a no-repeat window, charts in it are rejected and redrawn. If REPEAT_ATTEMPTS picks in a
+        row are all recent (the pool is about as small as the window), the pool is listed once and
+        a chart outside the window is picked from it; if every matching chart is in the window, the
+        one drawn longest ago is repeated. This fallback is uniform over the charts, whatever the
+        fairness, but leaves out categories weighted 0 like the sampler does.
+
+        Args:
+            chart_filter (ChartFilter): The filter criteria.
+            rng: The random number generator to use (the random module by default).
+            recent (Optional[RecentDraws]): Charts to avoid.
+            fairness (Fairness): How to weight the matching charts.
+
+        Returns:
+            Optional[int]: The drawn chart id, or None if no chart matches.
+        """
+        sampler = self.sampler(chart_filter, fairness)
+        if sampler is None:
+            return None
+        if recent is None or not recent.enabled:
+            return sampler.pick(rng)
+
+        for _ in range(REPEAT_ATTEMPTS):
+            chart = sampler.pick(rng)
+            if self.chart_key(chart) not in recent:
+                return chart
+        pool = self._fallback_pool(chart_filter, fairness)
+        fresh = [chart for chart in pool if self.chart_key(chart) not in recent]
+        if fresh:
+            return rng.choice(fresh)
+        pool_by_key = {self.chart_key(chart): chart for chart in pool}
+        for key in recent.oldest_first():
+            if key in pool_by_key:
+                return pool_by_key[key]
+        return sampler.pick(rng)
+
+    def draw_many(self, chart_filter: ChartFilter, count: int, rng=random,
+                  unique_songs: bool = False, fairness: Fairness = Fairness()) -> List[int]:
+        """
+        Draws several matching charts in one pass over the filter.
+
+        With replacement, every pick reuses the same sampler. With unique_songs and per chart
+        fairness, the matching pool is gathered once and a partial Fisher-Yates shuffle takes
+        charts from it until count different songs have been drawn; with other fairness modes,
+        picks of songs already drawn are redrawn.
+
+        Args:
+            chart_filter (ChartFilter): The filter criteria.
+            count (int): The number of charts to draw.
+            rng: The random number generator to use (the random module by default).
+            unique_songs (bool): Never draw two charts of the same song.
+            fairness (Fairness): How to weight the matching charts.
+
+        Returns:
+            List[int]: The drawn chart ids. With unique_songs this can be shorter than count
+                       if fewer songs match.
+        """
+        return self.draw_setlists(chart_filter, 1, count, rng, unique_songs, fairness)[0]
+
+    def draw_setlists(self, chart_filter: ChartFilter, setlists: int, size: int, rng=random,
+                      unique_songs: bool = False, fairness: Fairness = Fairness()) -> List[List[int]]:
+        """
+        Draws several setlists at once, resolving the filter only a single time for the whole batch.
+
+        With unique_songs and a fairness other than per chart, a setlist whose weighted picks keep
+        hitting songs it already holds is filled up uniformly from the matching charts of the other
+        songs, leaving out categories weighted 0.
+
+        Args:
+            chart_filter (ChartFilter): The filter criteria.
+            setlists (int): The number of setlists to draw.
+            size (int): The number of charts in each setlist.
+            rng: The random number generator to use (the random module by default).
+            unique_songs (bool): Never repeat a song inside a setlist.
+            fairness (Fairness): How to weight the matching charts.
+
+        Returns:
+            List[List[int]]: The chart ids of each setlist.
+        """
+        sampler = self.sampler(chart_filter, fairness)
+        if sampler is None:
+            return [[] for _ in range(setlists)]
+        if not unique_songs:
+            return [[sampler.pick(rng) for _ in range(size)] for _ in range(setlists)]
+
+        pool = self._fallback_pool(chart_filter, fairness)
+        if fairness.mode == "chart":
+            return [self._sample_unique_songs(pool, size, rng) for _ in range(setlists)]
+        result = []
+        chart_song = self.chart_song
+        for _ in range(setlists):
+            picked, seen_songs = [], set()
+            for _ in range(size * REPEAT_ATTEMPTS):
+                if len(picked) == size:
+                    break
+                chart = sampler.pick(rng)
+                if chart_song[chart] not in seen_songs:
+                    seen_songs.add(chart_song[chart])
+                    picked.append(chart)
+            # Too few songs carry the weight: fill up uniformly from the rest of the drawable pool
+            picked += self._sample_unique_songs(pool, size - len(picked), rng, seen_songs)
+            result.append(picked)
+        return result
+
+    def _fallback_pool(self, chart_filter: ChartFilter, fairness: Fairness) -> List[int]:
+        """
+        Lists the matching charts the fairness can draw at all, i.e. without the categories weighted 0.
+        """
+        excluded = set()
+        if fairness.mode == "custom":
+            excluded = {self.category_ids[category] for category, weight in fairness.category_weights
+                        if weight <= 0 and category in self.category_ids}
+        pool = []
+        for start, end in self.chart_ranges(chart_filter):
+            if excluded and self.chart_category[self.bucket_charts[start]] in excluded:
+                continue  # Every range lies in a single category's buckets
+            pool.extend(self.bucket_charts[start:end])
+        return pool
+
+    def _sample_unique_songs(self, pool: List[int], size: int, rng, seen_songs=None) -> List[int]:
+        """
+        Takes up to size charts of different songs (and not in seen_songs) from pool with a partial
+        Fisher-Yates shuffle. The pool is shuffled in place, which keeps it a valid pool for the next call.
+        """
+        chart_song = self.chart_song
+        picked = []
+        seen_songs = set() if seen_songs is None else seen_songs
+        for position in range(len(pool)):
+            if len(picked) == size:
+                break
+            swap = rng.randrange(position, len(pool))
+            pool[position], pool[swap] = pool[swap], pool[position]
+            chart = pool[position]
+            song_id = chart_song[chart]
+            if song_id not in seen_songs:
+                seen_songs.add(song_id)
+                picked.append(chart)
+        return picked
+
+    def chart_difficulty_name(self, chart: int) -> str:
+        """Returns the difficulty label of a chart, e.g. "4B NM"."""
+        return f"{KEY_MODES[self.chart_key_mode[chart]]} {DIFFICULTIES[self.chart_difficulty[chart]]}"
+
+    def chart_key(self, chart: int) -> Tuple[str, str, str]:
+        """Returns the (title, difficulty, category) identity of a chart; see chart_key()."""
+        return (self.titles[self.chart_song[chart]], self.chart_difficulty_name(chart),
+                self.category_names[self.chart_category[chart]])
+
+    def chart_tuple(self, chart: int) -> Tuple[str, str, str, str]:
+        """
+        Returns a chart as the (title, difficulty, level, category) tuple used throughout the app.
+        """
+        return (self.titles[self.chart_song[chart]], self.chart_difficulty_name(chart),
+                str(self.chart_level[chart]), self.category_names[self.chart_category[chart]])
+
+
+def read_song_list(csv_file) -> List[Tuple[str, str, List[Tuple[int, int, int]]]]:
+    """
+    Parses a song list CSV.
+
+    Args:
+        csv_file (str): The path to the CSV file.
+
+    Returns:
+        List[Tuple[str, str, List[Tuple[int, int, int]]]]: The title, the short category name and the
+            (key mode id, difficulty id, level) of every chart of each song, in file order.
+    """
+    songs = []
+    with open(csv_file, 'r', encoding='utf-8') as file:
+        reader = csv.reader(file)
+        header = next(reader)
+        # Resolve every level column a single time instead of once per row
+        level_columns = [(header.index(f"{key_mode} {diff}"), key_mode_id, diff_id)
+                         for key_mode_id, key_mode in enumerate(KEY_MODES)
+                         for diff_id, diff in enumerate(DIFFICULTIES)
+                         if f"{key_mode} {diff}" in header]
+        for row in reader:
+            levels = []
+            for column, key_mode_id, diff_id in level_columns:
+                level_str = row[column] if column < len(row) else ''
+                if level_str != '0' and level_str.isdigit():  # Ensure level is a number
+                    levels.append((key_mode_id, diff_id, int(level_str)))
+            songs.append((row[0], row[1], levels))
+    return songs
+
+
+# Chart indexes that have already been built, keyed by CSV path, with the file's (mtime, size)
+_chart_indexes: Dict[str, Tuple[Tuple[int, int], ChartIndex]] = {}
+
+
+def file_signature(path) -> Optional[Tuple[int, int]]:
+    """
+    Returns the (mtime in ns, size) of a file, which changes whenever the file is written, or None
+    if the file does not exist.
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def load_chart_index(csv_file) -> ChartIndex:
+    """
+    Returns the chart index for a song list CSV, parsing the file only the first time it is requested
+    and again whenever it has changed since (which also drops the old index's filter cache).
+
+    Args:
+        csv_file (str): The path to the CSV file.
+
+    Returns:
+        ChartIndex: The index for the CSV file.
+    """
+    signature = file_signature(csv_file)
+    cached = _chart_indexes.get(csv_file)
+    if cached is not None and signature is not None and cached[0] == signature:
+        return cached[1]
+    with METRICS.stage("load"):
+        index = ChartIndex.from_csv(csv_file)
+    _chart_indexes[csv_file] = (signature, index)
+    return index
+
+
+def set_chart_index(csv_file, index: ChartIndex):
+    """
+    Makes load_chart_index return the given index for a CSV path, e.g. one loaded from the
+    compiled cache in randomizer_cache.py.
+
+    Args:
+        csv_file (str): The path to the CSV file.
+        index (ChartIndex): The index to use for it.
+    """
+    _chart_indexes[csv_file] = (file_signature(csv_file), index)
+
+
+def get_songs_by_categories(csv_file, selected_categories: List[str], key_mode_filter: str,
+                           include_nm_hd_mx: bool, include_sc: bool,
+                           nm_hd_mx_min_level: int, nm_hd_mx_max_level: int,
+                           sc_min_level: int, sc_max_level: int,
+                           difficulty_levels: Tuple[Tuple[str, int, int], ...] = ()) -> List[Tuple[str, str, str, str]]:
+    """
+    Returns a list of song titles with their corresponding difficulty and level,
+    filtered by multiple categories, key mode, and separate level ranges for NM/HD/MX and SC.
+    The CSV file is only parsed on the first call; later calls are answered from the chart index.
+
+    Args:
+        csv_file (str): The path to the CSV file.
+        selected_categories (List[str]): A list of categories to filter by.
+                                         If "All" is in the list, no filter is applied.
+        key_mode_filter (str): The key mode to filter by (e.g., "4B", "5B", "6B", "8B"), or several
+                               joined with commas (e.g., "4B,6B"). If "All" or "" no filter applied.
+        include_nm_hd_mx (bool): Include NM, HD, and MX difficulties.
+        include_sc (bool): Include SC difficulty.
+        nm_hd_mx_min_level (int): The minimum level for NM, HD, and MX difficulties.
+        nm_hd_mx_max_level (int): The maximum level for NM, HD, and MX difficulties.
+        sc_min_level (int): The minimum level for SC difficulty.
+        sc_max_level (int): The maximum level for SC difficulty.
+        difficulty_levels (Tuple[Tuple[str, int, int], ...]): Individual difficulties with their own
+                                                              level ranges, e.g. (("MX", 10, 13),).
+                                                              Replaces the four arguments above.
+
+    Returns:
+        List[Tuple[str, str, str, str]]: A list of tuples, where each tuple contains the song title,
+                                     the difficulty (e.g., "4B - NM"), the level, and the category.
+    """
+
+    try:
+        index = load_chart_index(csv_file)
+        with METRICS.stage("filter"):
+            charts = index.filter(ChartFilter(tuple(selected_categories), key_mode_filter, include_nm_hd_mx, include_sc,
+                                              nm_hd_mx_min_level, nm_hd_mx_max_level, sc_min_level, sc_max_level,
+                                              tuple(difficulty_levels)))
+            return [index.chart_tuple(chart) for chart in charts]
+    except FileNotFoundError:
+        return [("Error: CSV file not found.", "", "", "")]
+    except Exception as e:
+        return [(f"An error occurred: {e}", "", "", "")]
+
+
+
+def load_full_category_names(category_file):
+    """
+    Loads the mapping of short category names to full category names from a CSV.
+
+    Args:
+        category_file (str): Path to the CSV file containing category mappings.
+
+    Returns:
+        Dict[str, str]: A dictionary where keys are short names and values are full names.
+    """
+
+    full_category_names = {}
+    try:
+        with open(category_file, 'r', encoding='utf-8') as file:
+            reader = csv.reader(file)
+            next(reader)  # Skip header
+            for row in reader:
+                full_category_names[row[0]] = {
+                    'full_name': row[1],
+                    'source': row[2]
+                }
+        full_category_names["All"] = {'full_name': "All Categories", 'source': "All"}  # added this line
+    except FileNotFoundError:
+        print(f"Error: Category file '{category_file}' not found.")
+    except Exception as e:
+        print(f"An error occurred while loading categories: {e}")
+    return full_category_names
+
+def load_history(history_file=HISTORY_FILE):
+    """
+    Loads the song history from a legacy comma-separated history file.
+    The history is now kept in randomizer_history.HistoryStore; this is used to import old files.
+
+    Args:
+        history_file (str): The path to the history file.
+
+    Returns:
+        List[Tuple[str, str, str, str]]: A list of tuples, where each tuple contains the song title,
+                                     difficulty, level, and category.
+    """
+    history_data = []
+    try:
+        with open(history_file, "r", encoding="utf-8") as file:
+            for line in file:
+                # Split from the right so that titles containing commas stay intact
+                song_data = line.strip().rsplit(",", 3)
+                if len(song_data) == 4:
+                    history_data.append(tuple(field.strip() for field in song_data))
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"An error occurred while loading history: {e}")
+    return history_data
+
+def format_stars(difficulty: str, level) -> str:
+    """
+    Renders a chart level as stars: ☆ for NM/HD/MX and ★ for SC, grouped by five.
+
+    Args:
+        difficulty (str): The difficulty, e.g. "4B NM".
+        level (str | int): The chart level.
+
+    Returns:
+        str: The star string, or "N/A" for an unknown difficulty.
+    """
+    if "NM" in difficulty or "HD" in difficulty or "MX" in difficulty:
+        stars = "☆" * int(level)
+    elif "SC" in difficulty:
+        stars = "★" * int(level)
+    else:
+        return "N/A"
+    # Add spaces every 5 stars
+    return " ".join([stars[i:i+5] for i in range(0, len(stars), 5)])
+
+def format_history_entry(song_data: Tuple[str, str, str, str]) -> str:
+    """
+    Formats a history entry as shown in the History tab and printed by the CLI.
+
+    Args:
+        song_data (Tuple[str, str, str, str]): The song title, difficulty, level, and category.
+
+    Returns:
+        str: The display line, e.g. "[RP] Title (4B NM) ☆☆☆☆☆ ☆".
+    """
+    return f"[{song_data[3].strip()}] {song_data[0]} ({song_data[1]}) " + format_stars(song_data[1], song_data[2])
@@ -0,0 +1,310 @@
+"""
+Tournament drafts: many setlists drawn at once under per-slot constraints.
+
+A draft is a grid of slots, one row per setlist and one column per round, and every slot has its
+own ChartFilter. round_filters() turns a level curve such as "8-9,10-11,12-13" into one filter per
+round. No song is used twice in the whole draft, and the categories are used as evenly as the
+candidates allow.
+
+The drafter is greedy with repair, on bucketed candidate pools:
+- Slots whose filters normalize to the same filter share one pool: the matching charts, taken from
+  the chart index bucket slices, grouped by category and shuffled.
+- Slots are filled scarcest pool first. Each slot takes the least used category that still has a
+  candidate and pops charts from it until one of an unused song comes up.
+- A slot left empty is repaired with an augmenting path: it takes the song of a filled slot that
+  can move to another unused song (or that can in turn take the song of a third slot, and so on).
+
+For very large events, draft() can split the setlists and the songs into disjoint parts, draft the
+parts in worker processes and merge them; slots a part could not fill are then filled from the
+whole song pool.
+
+Example:
+    python randomizer_cli.py --draft 8-9,10-11,12-13,14-15 --setlists 16 --key-mode 6B
+"""
+import random
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, NamedTuple, Optional, Sequence, Set, Tuple
+from randomizer_core import ChartFilter, ChartIndex, normalize_filter
+
+MAX_REPAIR_DEPTH = 64  # Filled slots moved at most to fill one empty slot
+
+
+class Draft(NamedTuple):
+    """
+    The result of a draft.
+    """
+    setlists: List[List[Optional[int]]]  # Chart id of every slot; None where no chart could be placed
+    unfilled: int  # Number of None slots
+    repaired: int  # Number of slots filled by moving the songs of other slots
+
+
+def parse_level_curve(text: str) -> Tuple[Tuple[int, int], ...]:
+    """
+    Parses a level curve written as "8-9, 10-11, 12" (one level or MIN-MAX range per round).
+
+    Args:
+        text (str): The curve.
+
+    Returns:
+        Tuple[Tuple[int, int], ...]: The (min, max) level range of every round.
+
+    Raises:
+        ValueError: If a round is not a level or a MIN-MAX range.
+    """
+    curve = []
+    for item in text.split(","):
+        item = item.strip()
+        low, separator, high = item.partition("-")
+        try:
+            min_level = int(low)
+            max_level = int(high) if separator else min_level
+        except ValueError:
+            raise ValueError(f"Invalid level range '{item}', expected LEVEL or MIN-MAX") from None
+        if min_level > max_level:
+            raise ValueError(f"Level range '{item}' is empty")
+        curve.append((min_level, max_level))
+    return tuple(curve)
+
+
+def round_filters(base_filter: ChartFilter, curve: Sequence[Tuple[int, int]]) -> List[ChartFilter]:
+    """
+    Returns one filter per round: the base filter with both level ranges (NM/HD/MX and SC), or the
+    range of every difficulty in difficulty_levels, set to the round's range of the curve.
+
+    Args:
+        base_filter (ChartFilter): The categories, key mode and difficulty groups of every round.
+        curve (Sequence[Tuple[int, int]]): The (min, max) level range of every round.
+    """
+    return [base_filter._replace(nm_hd_mx_min_level=min_level, nm_hd_mx_max_level=max_level,
+                                 sc_min_level=min_level, sc_max_level=max_level,
+                                 difficulty_levels=tuple((diff, min_level, max_level)
+                                                         for diff, _, _ in base_filter.difficulty_levels))
+            for min_level, max_level in curve]
+
+
+class _CandidatePool:
+    """The matching charts of one filter, shuffled and grouped by category id."""
+    __slots__ = ("charts", "by_category", "_songs")
+
+    def __init__(self, charts: List[int], by_category: Dict[int, List[int]]):
+        self.charts = charts
+        self.by_category = by_category  # Charts are popped from the end as they are tried
+        self._songs: Optional[Dict[int, List[int]]] = None
+
+    def songs(self, chart_song) -> Dict[int, List[int]]:
+        """Returns song id -> matching charts; only the repair needs it, so it is built on first use."""
+        if self._songs is None:
+            self._songs = {}
+            for chart in self.charts:
+                self._songs.setdefault(chart_song[chart], []).append(chart)
+        return self._songs
+
+
+class _Drafter:
+    """
+    Fills a flat list of slots with charts of different songs.
+    """
+
+    def __init__(self, index: ChartIndex, slots: Sequence[ChartFilter], rng, balance_categories: bool,
+                 allowed_songs: Optional[Set[int]] = None):
+        self.index = index
+        self.rng = rng
+        self.balance_categories = balance_categories
+        self.allowed_songs = allowed_songs
+        pools: Dict[ChartFilter, _CandidatePool] = {}
+        self.slot_pools: List[_CandidatePool] = []
+        for chart_filter in slots:
+            key = normalize_filter(chart_filter)
+            if key not in pools:
+                pools[key] = self._build_pool(key)
+            self.slot_pools.append(pools[key])
+        self.slot_charts: List[Optional[int]] = [None] * len(slots)
+        self.song_slots: Dict[int, int] = {}  # song id -> the slot using it
+        self.category_uses = [0] * len(index.category_names)
+        self.repaired = 0
+
+    def _build_pool(self, chart_filter: ChartFilter) -> _CandidatePool:
+        index = self.index
+        chart_song = index.chart_song
+        charts, by_category = [], {}
+        for start, end in index.chart_ranges(chart_filter):
+            bucket = index.bucket_charts[start:end]  # A slice never spans two categories
+            if self.allowed_songs is not None:
+                bucket = [chart for chart in bucket if chart_song[chart] in self.allowed_songs]
+            if bucket:
+                charts.extend(bucket)
+                by_category.setdefault(index.chart_category[bucket[0]], []).extend(bucket)
+        for category_charts in by_category.values():
+            self.rng.shuffle(category_charts)
+        return _CandidatePool(charts, by_category)
+
+    def assign(self, slot: int, chart: int):
+        """Puts a chart into a slot, releasing the song of the chart it replaces."""
+        index = self.index
+        previous = self.slot_charts[slot]
+        if previous is not None:
+            if self.song_slots.get(index.chart_song[previous]) == slot:
+                del self.song_slots[index.chart_song[previous]]
+            self.category_uses[index.chart_category[previous]] -= 1
+        self.slot_charts[slot] = chart
+        self.song_slots[index.chart_song[chart]] = slot
+        self.category_uses[index.chart_category[chart]] += 1
+
+    def run(self):
+        """Fills every empty slot greedily, scarcest pool first, then repairs the slots left empty."""
+        empty = [slot for slot, chart in enumerate(self.slot_charts) if chart is None]
+        empty.sort(key=lambda slot: len(self.slot_pools[slot].charts))
+        unfilled = [slot for slot in empty if not self._fill(slot)]
+        failed_pools = set()
+        for slot in unfilled:
+            pool = self.slot_pools[slot]
+            # A slot without an augmenting path never gets one later, nor does any slot with the same pool
+            if id(pool) in failed_pools:
+                continue
+            if self._augment(slot, {slot}, 0):
+                self.repaired += 1
+            else:
+                failed_pools.add(id(pool))
+
+    def _fill(self, slot: int) -> bool:
+        by_category = self.slot_pools[slot].by_category
+        chart_song = self.index.chart_song
+        while by_category:
+            if self.balance_categories:
+                fewest = min(self.category_uses[category] for category in by_category)
+                categories = [category for category in by_category if self.category_uses[category] == fewest]
+                category = categories[self.rng.randrange(len(categories))]
+            else:
+                # Every remaining candidate chart is equally likely
+                position = self.rng.randrange(sum(len(charts) for charts in by_category.values()))
+                for category, charts in by_category.items():
+                    if position < len(charts):
+                        break
+                    position -= len(charts)
+            charts = by_category[category]
+            while charts:
+                chart = charts.pop()
+                if chart_song[chart] not in self.song_slots:
+                    self.assign(slot, chart)
+                    if not charts:
+                        del by_category[category]
+                    return True
+            del by_category[category]  # Every song of this category in the pool is used
+        return False
+
+    def _augment(self, slot: int, visited: Set[int], depth: int) -> bool:
+        songs = self.slot_pools[slot].songs(self.index.chart_song)
+        for song, charts in songs.items():
+            if song not in self.song_slots:
+                self.assign(slot, charts[self.rng.randrange(len(charts))])
+                return True
+        if depth >= MAX_REPAIR_DEPTH:
+            return False
+        for song, charts in songs.items():
+            owner = self.song_slots.get(song)
+            if owner is None or owner in visited:
+                continue
+            visited.add(owner)
+            if self._augment(owner, visited, depth + 1):  # The owner moved to another song
+                self.assign(slot, charts[self.rng.randrange(len(charts))])
+                return True
+        return False
+
+
+def _partition_songs(index: ChartIndex, parts: int, rng) -> List[Set[int]]:
+    """Deals the songs of the index into disjoint parts, each with an equal share of every category."""
+    by_category: Dict[int, List[int]] = {}
+    for song in sorted({index.chart_song[chart] for chart in index.bucket_charts}):
+        by_category.setdefault(index.song_category[song], []).append(song)
+    partitions = [set() for _ in range(parts)]
+    dealt = 0
+    for songs in by_category.values():
+        rng.shuffle(songs)
+        for song in songs:
+            partitions[dealt % parts].add(song)
+            dealt += 1  # The next category continues where this one stopped, keeping the parts even
+    return partitions
+
+
+_worker_index: Optional[ChartIndex] = None  # The index of a draft worker process
+
+
+def _init_worker(index: ChartIndex):
+    global _worker_index
+    _worker_index = index
+
+
+def _draft_part(slots: List[ChartFilter], allowed_songs: Set[int], seed: int,
+                balance_categories: bool) -> Tuple[List[Optional[int]], int]:
+    drafter = _Drafter(_worker_index, slots, random.Random(seed), balance_categories, allowed_songs)
+    drafter.run()
+    return drafter.slot_charts, drafter.repaired
+
+
+def draft(index: ChartIndex, slots: Sequence[Sequence[ChartFilter]], rng=random, balance_categories: bool = True,
+          processes: int = 1) -> Draft:
+    """
+    Fills every slot of a draft with a matching chart, never using a song twice.
+
+    Args:
+        index (ChartIndex): The song list.
+        slots (Sequence[Sequence[ChartFilter]]): The filter of every slot, one sequence per setlist.
+        rng: The random number generator to use (the random module by default).
+        balance_categories (bool): Use the categories as evenly as possible; otherwise every
+                                   matching chart is equally likely.
+        processes (int): Worker processes for very large drafts. The setlists and the songs are split
+                         into this many parts; starting the processes takes longer than drafting a
+                         few hundred slots, so keep 1 for those.
+
+    Returns:
+        Draft: The chart ids by setlist and slot.
+    """
+    if index.bucket_offsets is None:
+        index.build_buckets()
+    flat = [chart_filter for setlist in slots for chart_filter in setlist]
+    drafter = _Drafter(index, flat, rng, balance_categories)
+    repaired = 0
+    processes = min(processes, len(slots))
+    if processes > 1:
+        partitions = _partition_songs(index, processes, rng)
+        # Contiguous groups of setlists, as flat slot ranges
+        bounds = [sum(len(setlist) for setlist in slots[:len(slots) * part // processes])
+                  for part in range(processes + 1)]
+        with ProcessPoolExecutor(processes, initializer=_init_worker, initargs=(index,)) as executor:
+            futures = [executor.submit(_draft_part, flat[bounds[part]:bounds[part + 1]], partitions[part],
+                                       rng.getrandbits(64), balance_categories)
+                       for part in range(processes)]
+            for part, future in enumerate(futures):
+                charts, part_repaired = future.result()
+                repaired += part_repaired
+                for slot, chart in enumerate(charts, start=bounds[part]):
+                    if chart is not None:
+                        drafter.assign(slot, chart)
+    drafter.run()  # Everything, or what the parts could not fill from their share of the songs
+    repaired += drafter.repaired
+
+    setlists, position = [], 0
+    for setlist in slots:
+        setlists.append(drafter.slot_charts[position:position + len(setlist)])
+        position += len(setlist)
+    return Draft(setlists, drafter.slot_charts.count(None), repaired)
+
+
+def draft_rounds(index: ChartIndex, base_filter: ChartFilter, setlists: int, curve: Sequence[Tuple[int, int]],
+                 rng=random, balance_categories: bool = True, processes: int = 1) -> Draft:
+    """
+    Drafts setlists that all follow the same level curve, one round per curve entry.
+
+    Args:
+        index (ChartIndex): The song list.
+        base_filter (ChartFilter): The categories, key mode and difficulty groups of every round.
+        setlists (int): The number of setlists, e.g. one per player or match.
+        curve (Sequence[Tuple[int, int]]): The (min, max) level range of every round.
+        rng: The random number generator to use (the random module by default).
+        balance_categories (bool): Use the categories as evenly as possible.
+        processes (int): Worker processes; see draft().
+
+    Returns:
+        Draft: The chart ids by setlist and round.
+    """
+    return draft(index, [round_filters(base_filter, curve)] * setlists, rng, balance_categories, processes)
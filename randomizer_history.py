@@ -0,0 +1,257 @@
+"""
+Append-only draw history backed by SQLite.
+
+Every draw is one row keyed by an increasing integer id (never reused, even after a clear), so
+the newest entries and any page of older entries are read through the primary key index without
+scanning the whole history. Rows are only ever deleted all at once, so the ids of the stored
+entries are consecutive and the n-th newest entry has id (newest id - n).
+Song titles are stored as separate columns, so commas in titles are no longer a problem.
+"""
+import os
+import sqlite3
+import time
+from array import array
+from typing import List, Tuple, NamedTuple, Optional
+from randomizer_core import HISTORY_FILE, RecentDraws, load_history
+
+HISTORY_DB_FILE = "history.db"
+
+
+class HistoryEntry(NamedTuple):
+    """
+    One history row. The first four fields match the (title, difficulty, level, category)
+    song tuples used throughout the app, so entries can be passed to format_history_entry.
+    """
+    title: str
+    difficulty: str
+    level: str
+    category: str
+    entry_id: int
+    drawn_at: float  # Seconds since the epoch
+
+
+class HistoryStore:
+    """
+    The draw history. Entries are only ever appended, or removed all at once by clear().
+    """
+
+    def __init__(self, db_file=HISTORY_DB_FILE, legacy_file: Optional[str] = HISTORY_FILE):
+        """
+        Opens (or creates) the history database.
+
+        Args:
+            db_file (str): The path to the SQLite database.
+            legacy_file (Optional[str]): A comma-separated history.txt to import once. After the
+                                         import it is renamed to "<name>.bak"; the database remembers
+                                         the imported file, so it is not imported again if the
+                                         rename fails (e.g. while another program locks it).
+        """
+        self.db_file = db_file
+        self.connection = sqlite3.connect(db_file)
+        # Write-ahead logging lets the GUI read the history while the I/O worker's connection writes,
+        # and with synchronous=NORMAL a commit no longer waits for the disk to flush
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS draws ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, drawn_at REAL NOT NULL, "
+            "title TEXT NOT NULL, difficulty TEXT NOT NULL, level TEXT NOT NULL, category TEXT NOT NULL)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS draws_drawn_at ON draws (drawn_at)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self.connection.commit()
+        if legacy_file and os.path.exists(legacy_file):
+            self._import_legacy(legacy_file)
+
+    def _import_legacy(self, legacy_file):
+        stat = os.stat(legacy_file)
+        signature = f"{stat.st_mtime_ns}:{stat.st_size}"
+        imported = self.connection.execute("SELECT value FROM meta WHERE key = 'legacy_import'").fetchone()
+        if imported is None or imported[0] != signature:
+            songs = load_history(legacy_file)
+            # Marking the file as imported opens the transaction that append_many commits, so the
+            # rows and the mark are saved together or not at all
+            self.connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('legacy_import', ?)",
+                                    (signature,))
+            # The text file has no timestamps; keep the order and date everything to the file's mtime
+            self.append_many(songs, stat.st_mtime)
+        try:
+            os.replace(legacy_file, legacy_file + ".bak")
+        except OSError as e:
+            print(f"Could not rename the imported '{legacy_file}': {e}")
+
+    def append(self, song_data: Tuple[str, str, str, str], drawn_at: Optional[float] = None) -> HistoryEntry:
+        """
+        Appends one drawn song.
+
+        Args:
+            song_data (Tuple[str, str, str, str]): The song title, difficulty, level, and category.
+            drawn_at (Optional[float]): The draw time; defaults to now.
+
+        Returns:
+            HistoryEntry: The stored entry.
+        """
+        return self.append_many([song_data], drawn_at)[0]
+
+    def append_many(self, songs: List[Tuple[str, str, str, str]],
+                    drawn_at: Optional[float] = None) -> List[HistoryEntry]:
+        """
+        Appends several drawn songs in a single transaction.
+
+        Args:
+            songs (List[Tuple[str, str, str, str]]): Tuples of song title, difficulty, level, and category.
+            drawn_at (Optional[float]): The draw time of every song; defaults to now.
+
+        Returns:
+            List[HistoryEntry]: The stored entries, oldest first.
+        """
+        return self.append_batches([(songs, drawn_at)])[0]
+
+    def append_batches(self, batches: List[Tuple[List[Tuple[str, str, str, str]], Optional[float]]]
+                       ) -> List[List[HistoryEntry]]:
+        """
+        Appends several groups of drawn songs, each with its own draw time, in a single transaction.
+
+        Args:
+            batches (List[Tuple[List[Tuple[str, str, str, str]], Optional[float]]]): Pairs of songs (as in
+                append_many) and their draw time, which defaults to now.
+
+        Returns:
+            List[List[HistoryEntry]]: The stored entries of every group, oldest first.
+        """
+        results = []
+        with self.connection:
+            cursor = self.connection.cursor()
+            for songs, drawn_at in batches:
+                if drawn_at is None:
+                    drawn_at = time.time()
+                entries = []
+                for title, difficulty, level, category in songs:
+                    cursor.execute("INSERT INTO draws (drawn_at, title, difficulty, level, category) "
+                                   "VALUES (?, ?, ?, ?, ?)", (drawn_at, title, difficulty, str(level), category))
+                    entries.append(HistoryEntry(title, difficulty, str(level), category, cursor.lastrowid, drawn_at))
+                results.append(entries)
+        return results
+
+    def _select(self, where: str, parameters: tuple, limit: int) -> List[HistoryEntry]:
+        rows = self.connection.execute(
+            f"SELECT title, difficulty, level, category, id, drawn_at FROM draws {where} ORDER BY id DESC LIMIT ?",
+            parameters + (limit,))
+        return [HistoryEntry(*row) for row in rows]
+
+    def tail(self, limit: int) -> List[HistoryEntry]:
+        """
+        Returns the most recent entries, newest first.
+
+        Args:
+            limit (int): The maximum number of entries.
+        """
+        return self._select("", (), limit)
+
+    def before(self, entry_id: int, limit: int) -> List[HistoryEntry]:
+        """
+        Returns the entries older than entry_id, newest first.
+
+        Args:
+            entry_id (int): The id of the oldest entry already loaded.
+            limit (int): The maximum number of entries.
+        """
+        return self._select("WHERE id < ?", (entry_id,), limit)
+
+    def after(self, entry_id: int, limit: int) -> List[HistoryEntry]:
+        """
+        Returns the entries newer than entry_id, oldest first.
+
+        Args:
+            entry_id (int): The id of the newest entry already processed.
+            limit (int): The maximum number of entries.
+        """
+        rows = self.connection.execute(
+            "SELECT title, difficulty, level, category, id, drawn_at FROM draws WHERE id > ? ORDER BY id LIMIT ?",
+            (entry_id, limit))
+        return [HistoryEntry(*row) for row in rows]
+
+    def since(self, drawn_at: float) -> List[HistoryEntry]:
+        """
+        Returns the entries drawn at or after the given time, newest first.
+
+        Args:
+            drawn_at (float): The earliest draw time, in seconds since the epoch.
+        """
+        return self._select("WHERE drawn_at >= ?", (drawn_at,), -1)
+
+    def entries(self, entry_ids) -> List[HistoryEntry]:
+        """
+        Returns the entries with the given ids, newest first.
+
+        Args:
+            entry_ids (Iterable[int]): The ids; ids that do not exist are skipped.
+        """
+        entry_ids = list(entry_ids)
+        if not entry_ids:
+            return []
+        placeholders = ", ".join("?" * len(entry_ids))
+        return self._select(f"WHERE id IN ({placeholders})", tuple(entry_ids), -1)
+
+    def id_range(self) -> Tuple[int, int]:
+        """Returns the oldest and newest entry ids, or (0, 0) if the history is empty."""
+        oldest, newest = self.connection.execute("SELECT MIN(id), MAX(id) FROM draws").fetchone()
+        return (oldest, newest) if newest is not None else (0, 0)
+
+    def last_id_before(self, drawn_at: float) -> Optional[int]:
+        """
+        Returns the id of the newest entry drawn before the given time, or None.
+
+        Args:
+            drawn_at (float): The time, in seconds since the epoch.
+        """
+        return self.connection.execute("SELECT MAX(id) FROM draws WHERE drawn_at < ?", (drawn_at,)).fetchone()[0]
+
+    def search_ids(self, text: str) -> array:
+        """
+        Returns the ids of the entries whose title or category contains text (case-insensitive for
+        ASCII), newest first. Only the ids are loaded, so large histories stay cheap to search.
+
+        Args:
+            text (str): The text to look for.
+        """
+        pattern = "%" + text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        rows = self.connection.execute(
+            "SELECT id FROM draws WHERE title LIKE ? ESCAPE '\\' OR category LIKE ? ESCAPE '\\' ORDER BY id DESC",
+            (pattern, pattern))
+        return array('I', (row[0] for row in rows))
+
+    def __len__(self):
+        oldest, newest = self.id_range()
+        return newest - oldest + 1 if newest else 0
+
+    def clear(self):
+        """Removes every entry."""
+        with self.connection:
+            self.connection.execute("DELETE FROM draws")
+
+    def close(self):
+        self.connection.close()
+
+
+def load_recent_draws(history_store: HistoryStore, max_draws: int = 0, max_age: float = 0) -> RecentDraws:
+    """
+    Builds the no-repeat window and seeds it from the end of the history, reading only the
+    entries that can still be inside the window.
+
+    Args:
+        history_store (HistoryStore): The draw history.
+        max_draws (int): Exclude charts drawn in the last max_draws draws; 0 disables the limit.
+        max_age (float): Exclude charts drawn in the last max_age seconds; 0 disables the limit.
+
+    Returns:
+        RecentDraws: The seeded window.
+    """
+    recent = RecentDraws(max_draws, max_age)
+    # A draw is in the window if it is within either limit
+    entries = {}
+    if max_draws:
+        entries.update((entry.entry_id, entry) for entry in history_store.tail(max_draws))
+    if max_age:
+        entries.update((entry.entry_id, entry) for entry in history_store.since(time.time() - max_age))
+    recent.seed(entries[entry_id] for entry_id in sorted(entries))
+    return recent
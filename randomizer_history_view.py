@@ -0,0 +1,220 @@
+"""
+Virtualized history list for the History tab.
+
+Only the rows that fit in the window are formatted and drawn: the view keeps a fixed set of
+canvas text items and, on every scroll, reads just those entries from the HistoryStore by id.
+The scrollbar represents the whole history (or the search results), so memory use and redraw
+cost stay the same no matter how long the history gets.
+
+The view never reads the history itself: every read is handed to a submit_history function
+(IOWorker.submit_history), which runs it on the I/O thread and calls back on the Tk thread. Reads
+are numbered, so a reply that a newer scroll, search or refresh has overtaken is dropped.
+"""
+import time
+import tkinter as tk
+from typing import Callable, List, Optional
+from randomizer_core import format_history_entry
+from randomizer_history import HistoryEntry, HistoryStore
+from randomizer_metrics import METRICS
+
+DATE_FORMAT = "%Y-%m-%d"
+
+
+def format_history_row(entry: HistoryEntry) -> str:
+    """Formats a history entry as one row of the view, prefixed with its draw time."""
+    return f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(entry.drawn_at))}  {format_history_entry(entry)}"
+
+
+def _read_size(history_store: HistoryStore, search_text: Optional[str]):
+    """Runs on the I/O thread: the id range of the history and, when searching, the matching ids."""
+    oldest_id, newest_id = history_store.id_range()
+    return oldest_id, newest_id, None if search_text is None else history_store.search_ids(search_text)
+
+
+def _read_rows(history_store: HistoryStore, matches, newest_id: int, top: int, count: int) -> List[HistoryEntry]:
+    """Runs on the I/O thread: the entries of count rows starting at position top."""
+    if matches is not None:
+        return history_store.entries(matches[top:top + count])
+    return history_store.before(newest_id - top + 1, count)
+
+
+class HistoryView(tk.Frame):
+    """
+    A scrollable, searchable list of the draw history, newest first, with a jump-to-date box.
+    """
+
+    def __init__(self, master, submit_history: Callable, rows: int = 20, width: int = 800, row_height: int = 24,
+                 font=("Helvetica", 12, "bold"), bg="gray", fg="black"):
+        """
+        Args:
+            master: The parent widget.
+            submit_history (Callable): Runs function(history_store, *args) off the Tk thread and calls
+                                       callback with the result on it, like IOWorker.submit_history.
+            rows (int): The number of visible rows.
+            width (int): The width of the list in pixels.
+            row_height (int): The height of one row in pixels.
+            font: The font of the rows.
+            bg: The background color of the list.
+            fg: The text color of the rows.
+        """
+        super().__init__(master)
+        self.submit_history = submit_history
+        self.rows = rows
+        self.row_height = row_height
+        self.top = 0  # Position of the first visible row; 0 is the newest entry
+        self.total = 0  # Number of rows (entries, or search results)
+        self.newest_id = 0
+        self.matches = None  # Ids of the search results, newest first; None when not searching
+        self.search_text = ""
+        self._size_request = 0  # Number of the latest size (and search) read
+        self._rows_request = 0  # Number of the latest row read
+
+        controls = tk.Frame(self)
+        controls.pack(fill=tk.X, pady=(0, 5))
+        tk.Label(controls, text="Search:", font=("Helvetica", 12)).pack(side=tk.LEFT, padx=(0, 5))
+        self.search_var = tk.StringVar(self)
+        search_entry = tk.Entry(controls, textvariable=self.search_var, width=25, font=("Helvetica", 12))
+        search_entry.pack(side=tk.LEFT, padx=(0, 10))
+        search_entry.bind("<Return>", lambda event: self.search())
+        tk.Button(controls, text="Search", command=self.search, font=("Helvetica", 12)).pack(side=tk.LEFT, padx=(0, 5))
+        tk.Button(controls, text="Show All", command=self.show_all, font=("Helvetica", 12)).pack(side=tk.LEFT,
+                                                                                                padx=(0, 20))
+        tk.Label(controls, text="Jump to date:", font=("Helvetica", 12)).pack(side=tk.LEFT, padx=(0, 5))
+        self.date_var = tk.StringVar(self)
+        date_entry = tk.Entry(controls, textvariable=self.date_var, width=12, font=("Helvetica", 12))
+        date_entry.pack(side=tk.LEFT, padx=(0, 5))
+        date_entry.bind("<Return>", lambda event: self.jump_to_date())
+        tk.Button(controls, text="Go", command=self.jump_to_date, font=("Helvetica", 12)).pack(side=tk.LEFT)
+        self.status_label = tk.Label(controls, text="", font=("Helvetica", 10), fg="gray")
+        self.status_label.pack(side=tk.RIGHT)
+
+        list_frame = tk.Frame(self)
+        list_frame.pack()
+        self.canvas = tk.Canvas(list_frame, width=width, height=rows * row_height, bg=bg, highlightthickness=0)
+        self.canvas.pack(side=tk.LEFT)
+        self.scrollbar = tk.Scrollbar(list_frame, orient=tk.VERTICAL, command=self.on_scrollbar)
+        self.scrollbar.pack(side=tk.LEFT, fill=tk.Y)
+        # One reusable text item per visible row
+        self.row_items = [self.canvas.create_text(5, row * row_height + row_height // 2, anchor=tk.W, text="",
+                                                  font=font, fill=fg)
+                          for row in range(rows)]
+        for widget in (self.canvas, self.scrollbar):
+            widget.bind("<MouseWheel>", self.on_mouse_wheel)  # Windows and macOS
+            widget.bind("<Button-4>", lambda event: self.scroll_to(self.top - 3))  # X11
+            widget.bind("<Button-5>", lambda event: self.scroll_to(self.top + 3))
+
+    def render(self):
+        """Updates the scrollbar and reads the visible rows; _draw_rows draws them when they arrive."""
+        if self.total:
+            self.scrollbar.set(self.top / self.total, min(self.top + self.rows, self.total) / self.total)
+        else:
+            self.scrollbar.set(0.0, 1.0)
+        self._rows_request += 1
+        request = self._rows_request
+        count = min(self.rows, self.total - self.top)
+        if count <= 0:
+            self._draw_rows(request, [])
+            return
+        self.submit_history(_read_rows, self.matches, self.newest_id, self.top, count,
+                            callback=lambda entries: self._draw_rows(request, entries))
+
+    def _draw_rows(self, request: int, entries: List[HistoryEntry]):
+        if request != self._rows_request:
+            return  # The view was scrolled again in the meantime
+        with METRICS.stage("render"):
+            for row, item in enumerate(self.row_items):
+                self.canvas.itemconfig(item, text=format_history_row(entries[row]) if row < len(entries) else "")
+
+    def refresh(self, added: int = 0):
+        """
+        Re-reads the size of the history and redraws. Call after draws are added or the history is cleared.
+
+        Args:
+            added (int): The number of entries added since the last refresh. If the view is scrolled
+                         down, it moves with the new rows so that the same rows stay in view.
+        """
+        self._request_size(self.search_text if self.matches is not None else None, added=added)
+
+    def _request_size(self, search_text: Optional[str], added: int = 0, top: Optional[int] = None):
+        self._size_request += 1
+        request = self._size_request
+        self.submit_history(_read_size, search_text,
+                            callback=lambda result: self._apply_size(request, result, added, top))
+
+    def _apply_size(self, request: int, result, added: int, top: Optional[int]):
+        if request != self._size_request:
+            return  # A newer refresh or search was started in the meantime
+        previous_total = self.total
+        oldest_id, self.newest_id, self.matches = result
+        if self.matches is not None:
+            self.total = len(self.matches)
+            self.status_label.config(text=f"{self.total} matching draws")
+        else:
+            self.total = self.newest_id - oldest_id + 1 if self.newest_id else 0
+        if top is not None:
+            self.top = top
+        elif self.top and added and self.total > previous_total:
+            self.top += self.total - previous_total
+        self.scroll_to(self.top)
+
+    def scroll_to(self, top: int):
+        """Shows the rows starting at position top (0 is the newest)."""
+        self.top = max(0, min(top, self.total - self.rows))
+        self.render()
+
+    def on_scrollbar(self, action, amount, unit=None):
+        """Handles the scrollbar's "moveto" and "scroll" commands."""
+        if action == tk.MOVETO:
+            self.scroll_to(int(float(amount) * self.total))
+        elif action == tk.SCROLL:
+            self.scroll_to(self.top + int(amount) * (self.rows if unit == tk.PAGES else 1))
+
+    def on_mouse_wheel(self, event):
+        self.scroll_to(self.top - event.delta // abs(event.delta) * 3 if event.delta else self.top)
+
+    def search(self):
+        """Shows only the entries whose title or category contains the search text."""
+        text = self.search_var.get().strip()
+        if not text:
+            self.show_all()
+            return
+        self.search_text = text
+        self.status_label.config(text="Searching...")
+        self._request_size(text, top=0)
+
+    def show_all(self):
+        """Leaves the search and shows the whole history."""
+        self.search_var.set("")
+        self.status_label.config(text="")
+        self._request_size(None, top=0)
+
+    def jump_to_date(self):
+        """Scrolls to the last draw made on or before the date in the jump-to-date box (YYYY-MM-DD)."""
+        try:
+            day = time.mktime(time.strptime(self.date_var.get().strip(), DATE_FORMAT))
+        except ValueError:
+            self.status_label.config(text="Enter a date as YYYY-MM-DD")
+            return
+        self.submit_history(HistoryStore.last_id_before, day + 24 * 60 * 60,  # Up to the end of that day
+                            callback=self._jump_to)
+
+    def _jump_to(self, entry_id: Optional[int]):
+        if entry_id is None:
+            self.status_label.config(text="No draws on or before that date")
+            return
+        self.status_label.config(text="")
+        self.scroll_to(self.position_of(entry_id))
+
+    def position_of(self, entry_id: int) -> int:
+        """Returns the row position of an entry, or of the nearest older search result."""
+        if self.matches is None:
+            return self.newest_id - entry_id
+        # matches is sorted newest (largest id) first
+        low, high = 0, len(self.matches)
+        while low < high:
+            middle = (low + high) // 2
+            if self.matches[middle] > entry_id:
+                low = middle + 1
+            else:
+                high = middle
+        return low
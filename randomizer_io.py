@@ -0,0 +1,185 @@
+"""
+Background file I/O for the GUI.
+
+Writing the history and reading the song list on the Tk thread freezes the window on slow or
+network-synced disks (e.g. a OneDrive-backed profile). IOWorker does that work on one daemon thread:
+
+- Tasks wait in a bounded queue. When it is full, the caller blocks until the worker catches up
+  instead of the queue growing without limit.
+- History appends that are waiting in the queue are coalesced and written in a single transaction.
+- The worker opens its own HistoryStore, as an SQLite connection belongs to the thread that opened it.
+- Results go back through a second queue that the GUI drains with after(), so callbacks always run
+  on the Tk thread.
+- Tasks run in the order they were queued, and close() finishes all of them before the app exits.
+"""
+import queue
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+from randomizer_history import HISTORY_DB_FILE, HistoryStore
+from randomizer_metrics import METRICS
+
+IO_QUEUE_SIZE = 256  # Tasks waiting for the worker before submitting blocks
+
+_APPEND, _CLEAR, _CALL, _STOP = range(4)
+
+
+def _print_error(error: Exception):
+    print(f"An error occurred in the background I/O: {error}")
+
+
+class IOWorker:
+    """
+    Runs history writes and other file I/O on a background thread.
+    """
+
+    def __init__(self, db_file=HISTORY_DB_FILE, max_pending: int = IO_QUEUE_SIZE):
+        """
+        Args:
+            db_file (str): The history database the worker writes to.
+            max_pending (int): The number of tasks that can wait for the worker.
+        """
+        self.db_file = db_file
+        self.history_store: Optional[HistoryStore] = None  # Opened on the worker thread
+        self._tasks = queue.Queue(max_pending)
+        self._results = queue.Queue()  # (callback, result) pairs waiting for poll()
+        self._thread = threading.Thread(target=self._run, name="randomizer-io", daemon=True)
+
+    def start(self):
+        """Starts the worker thread."""
+        self._thread.start()
+
+    def _put(self, kind: int, payload, callback: Optional[Callable], error_callback: Optional[Callable]):
+        self._tasks.put((kind, payload, callback, error_callback or _print_error))
+
+    def append_history(self, songs: List[Tuple[str, str, str, str]], drawn_at: Optional[float] = None,
+                       callback: Optional[Callable] = None, error_callback: Optional[Callable] = None) -> float:
+        """
+        Queues drawn songs to be saved to the history.
+
+        Args:
+            songs (List[Tuple[str, str, str, str]]): Tuples of song title, difficulty, level, and category.
+            drawn_at (Optional[float]): The draw time; defaults to now, not to when the songs are written.
+            callback (Optional[Callable]): Called on the Tk thread with the stored entries.
+            error_callback (Optional[Callable]): Called on the Tk thread with the exception if saving fails.
+
+        Returns:
+            float: The draw time.
+        """
+        if drawn_at is None:
+            drawn_at = time.time()
+        self._put(_APPEND, (songs, drawn_at), callback, error_callback)
+        return drawn_at
+
+    def clear_history(self, callback: Optional[Callable] = None, error_callback: Optional[Callable] = None):
+        """Queues removing every history entry; callback is called with None once done."""
+        self._put(_CLEAR, None, callback, error_callback)
+
+    def submit(self, function: Callable, *args, callback: Optional[Callable] = None,
+               error_callback: Optional[Callable] = None):
+        """
+        Queues a call to run on the worker thread.
+
+        Args:
+            function (Callable): The function to call with args.
+            callback (Optional[Callable]): Called on the Tk thread with the return value.
+            error_callback (Optional[Callable]): Called on the Tk thread with the exception if the call fails.
+        """
+        self._put(_CALL, (function, args), callback, error_callback)
+
+    def submit_history(self, function: Callable, *args, callback: Optional[Callable] = None,
+                       error_callback: Optional[Callable] = None):
+        """Like submit, but function is called with the worker's HistoryStore before args."""
+        self.submit(lambda: function(self.history_store, *args), callback=callback, error_callback=error_callback)
+
+    def poll(self) -> int:
+        """
+        Runs the callbacks of finished tasks. Call it from the Tk thread, e.g. every few ms with after().
+        An exception raised by a callback is printed and does not stop the other callbacks.
+
+        Returns:
+            int: The number of callbacks run.
+        """
+        handled = 0
+        while True:
+            try:
+                callback, result = self._results.get_nowait()
+            except queue.Empty:
+                return handled
+            try:
+                callback(result)
+            except Exception as e:
+                print(f"An error occurred in a background I/O callback: {e}")
+            handled += 1
+
+    def close(self, timeout: Optional[float] = None) -> bool:
+        """
+        Finishes the queued tasks and stops the worker. Callbacks that have not been polled yet are dropped.
+
+        Args:
+            timeout (Optional[float]): Seconds to wait for the worker; None waits until it is done.
+
+        Returns:
+            bool: True if every queued task was finished.
+        """
+        if not self._thread.is_alive():
+            return True
+        self._tasks.put((_STOP, None, None, None))
+        self._thread.join(timeout)
+        return not self._thread.is_alive()
+
+    def _run(self):
+        self.history_store = HistoryStore(self.db_file, legacy_file=None)  # The GUI's store imports history.txt
+        try:
+            while True:
+                batch = [self._tasks.get()]
+                while True:  # Take everything else already waiting, so that the appends are written together
+                    try:
+                        batch.append(self._tasks.get_nowait())
+                    except queue.Empty:
+                        break
+                if not self._run_batch(batch):
+                    return
+        finally:
+            self.history_store.close()
+
+    def _run_batch(self, batch) -> bool:
+        """Runs queued tasks in order, writing consecutive appends in one transaction. False once stopped."""
+        appends = []
+        for kind, payload, callback, error_callback in batch:
+            if kind == _APPEND:
+                appends.append((payload, callback, error_callback))
+                continue
+            self._write(appends)
+            appends = []
+            if kind == _STOP:
+                return False
+            if kind == _CLEAR:
+                self._call(self.history_store.clear, (), callback, error_callback)
+            else:
+                self._call(payload[0], payload[1], callback, error_callback)
+        self._write(appends)
+        return True
+
+    def _write(self, appends):
+        if not appends:
+            return
+        try:
+            with METRICS.stage("history"):
+                results = self.history_store.append_batches([payload for payload, _, _ in appends])
+        except Exception as e:
+            for _, _, error_callback in appends:
+                self._results.put((error_callback, e))
+            return
+        for (_, callback, _), entries in zip(appends, results):
+            if callback is not None:
+                self._results.put((callback, entries))
+
+    def _call(self, function: Callable, args: tuple, callback: Optional[Callable], error_callback: Callable):
+        try:
+            result = function(*args)
+        except Exception as e:
+            self._results.put((error_callback, e))
+            return
+        if callback is not None:
+            self._results.put((callback, result))
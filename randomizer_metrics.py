@@ -0,0 +1,217 @@
+"""
+Opt-in timing and allocation instrumentation for the randomizer's stages.
+
+Code that does measurable work wraps it in a named stage:
+
+    with METRICS.stage("draw"):
+        chart = index.draw(chart_filter)
+
+While the metrics are disabled (the default) a stage is a shared no-op context manager, so the
+instrumentation costs one attribute lookup. Once enabled, every stage records its wall time and
+the change in allocated memory blocks; with allocation tracing on (tracemalloc) the peak traced
+bytes are recorded too. The last samples of each stage are kept in a ring buffer from which the
+percentiles are computed on demand.
+
+Stages can be recorded from any thread (the GUI's I/O worker and the server's executor record
+"history"). The samples are guarded by a lock, but the allocation counters are process-wide:
+sys.getallocatedblocks() and the tracemalloc peak include whatever other threads allocated while
+a stage ran, so the block deltas and peaks of overlapping stages are only indicative.
+
+Stages used by the app: "load" (song database), "filter" (resolving a filter and building its
+sampler), "draw", "history" (reading and writing the history) and "render" (updating the GUI).
+"""
+import csv
+import json
+import math
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import deque
+from contextlib import nullcontext
+from typing import Callable, Dict, List, Tuple
+
+METRICS_WINDOW = 1000  # Samples kept per stage for the rolling percentiles
+PERCENTILES = (50, 90, 99)
+_NO_STAGE = nullcontext()
+
+
+class _Stage:
+    """Context manager recording one sample of a stage."""
+    __slots__ = ("metrics", "name", "started", "blocks")
+
+    def __init__(self, metrics: 'Metrics', name: str):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        if self.metrics.trace_allocations:
+            tracemalloc.reset_peak()
+        self.blocks = sys.getallocatedblocks()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.started
+        blocks = sys.getallocatedblocks() - self.blocks
+        peak = tracemalloc.get_traced_memory()[1] if self.metrics.trace_allocations else 0
+        self.metrics.record(self.name, elapsed, blocks, peak)
+        return False
+
+
+def _percentile(sorted_values: List[float], percent: float) -> float:
+    """Nearest-rank percentile of an already sorted, non-empty list."""
+    rank = max(0, math.ceil(percent / 100 * len(sorted_values)) - 1)
+    return sorted_values[rank]
+
+
+class Metrics:
+    """
+    Per-stage samples of wall time, allocated block deltas and peak traced bytes.
+    """
+
+    def __init__(self, window: int = METRICS_WINDOW):
+        """
+        Args:
+            window (int): The number of recent samples kept per stage.
+        """
+        self.window = window
+        self.enabled = False
+        self.trace_allocations = False
+        self._samples: Dict[str, deque] = {}  # stage -> (seconds, blocks, peak bytes), oldest first
+        self._totals: Dict[str, int] = {}  # stage -> samples recorded since the last reset
+        self._lock = threading.Lock()  # Guards _samples and _totals; stages are recorded from several threads
+
+    def enable(self, trace_allocations: bool = False):
+        """
+        Starts recording.
+
+        Args:
+            trace_allocations (bool): Also trace allocations with tracemalloc to record peak bytes.
+                                      This slows everything down noticeably.
+        """
+        self.enabled = True
+        self.set_trace_allocations(trace_allocations)
+
+    def disable(self):
+        """Stops recording; the samples are kept."""
+        self.enabled = False
+        self.set_trace_allocations(False)
+
+    def set_trace_allocations(self, trace_allocations: bool):
+        if trace_allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        elif not trace_allocations and self.trace_allocations and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self.trace_allocations = trace_allocations
+
+    def stage(self, name: str):
+        """
+        Returns a context manager that records the enclosed work as one sample of the stage.
+
+        Args:
+            name (str): The stage, e.g. "draw".
+        """
+        return _Stage(self, name) if self.enabled else _NO_STAGE
+
+    def record(self, name: str, seconds: float, blocks: int = 0, peak_bytes: int = 0):
+        """Adds one sample to a stage."""
+        with self._lock:
+            samples = self._samples.get(name)
+            if samples is None:
+                samples = self._samples[name] = deque(maxlen=self.window)
+            samples.append((seconds, blocks, peak_bytes))
+            self._totals[name] = self._totals.get(name, 0) + 1
+
+    def reset(self):
+        """Removes every sample."""
+        with self._lock:
+            self._samples.clear()
+            self._totals.clear()
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """
+        Summarizes the samples in the window of every stage.
+
+        Returns:
+            Dict[str, Dict[str, float]]: Per stage: the total number of samples, the number in the
+                window, mean, p50, p90, p99 and max wall time in milliseconds, the mean change in
+                allocated blocks and the maximum peak traced KiB.
+        """
+        with self._lock:  # Copied so that other threads can keep recording while the percentiles are computed
+            snapshot = [(name, list(samples), self._totals[name]) for name, samples in self._samples.items()]
+        summary = {}
+        for name, samples, total in snapshot:
+            times = sorted(seconds * 1000 for seconds, _, _ in samples)
+            stats = {"count": total, "window": len(times), "mean_ms": sum(times) / len(times)}
+            for percent in PERCENTILES:
+                stats[f"p{percent}_ms"] = _percentile(times, percent)
+            stats["max_ms"] = times[-1]
+            stats["mean_blocks"] = sum(blocks for _, blocks, _ in samples) / len(samples)
+            stats["peak_kib"] = max(peak for _, _, peak in samples) / 1024
+            summary[name] = stats
+        return summary
+
+    def format_summary(self) -> str:
+        """Returns the summary as a fixed-width text table, one stage per line."""
+        columns = ["count", "mean_ms"] + [f"p{percent}_ms" for percent in PERCENTILES] + ["max_ms", "mean_blocks",
+                                                                                          "peak_kib"]
+        lines = [f"{'stage':<10}" + "".join(f"{column:>12}" for column in columns)]
+        for name, stats in sorted(self.summary().items()):
+            lines.append(f"{name:<10}" + "".join(f"{stats[column]:>12.0f}" if column == "count"
+                                                 else f"{stats[column]:>12.3f}" for column in columns))
+        return "\n".join(lines)
+
+    def dump(self, path):
+        """
+        Writes the summary to a file: CSV if the path ends in ".csv", JSON otherwise.
+
+        Args:
+            path (str): The output path.
+        """
+        summary = self.summary()
+        with open(path, "w", encoding="utf-8", newline="") as file:
+            if os.path.splitext(path)[1].lower() == ".csv":
+                writer = csv.writer(file)
+                columns = list(next(iter(summary.values()), {}))
+                writer.writerow(["timestamp", "host", "stage"] + columns)
+                timestamp = time.strftime("%Y-%m-%dT%H:%M:%S")
+                for name, stats in summary.items():
+                    writer.writerow([timestamp, _host(), name] + [stats[column] for column in columns])
+            else:
+                json.dump({"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "host": _host(),
+                           "tracing_allocations": self.trace_allocations, "stages": summary}, file, indent=2)
+                file.write("\n")
+
+
+def _host() -> str:
+    try:
+        return os.uname().nodename
+    except AttributeError:  # Windows
+        return os.environ.get("COMPUTERNAME", "")
+
+
+def profile_call(function: Callable, *args, limit: int = 25, **kwargs) -> Tuple[object, str]:
+    """
+    Runs one call under cProfile.
+
+    Args:
+        function (Callable): The function to profile.
+        limit (int): The number of functions listed in the report.
+
+    Returns:
+        Tuple[object, str]: The function's return value and the report, sorted by cumulative time.
+    """
+    import cProfile, io, pstats  # Only needed when profiling; keeps the CLI startup fast
+    profiler = cProfile.Profile()
+    result = profiler.runcall(function, *args, **kwargs)
+    report = io.StringIO()
+    pstats.Stats(profiler, stream=report).sort_stats("cumulative").print_stats(limit)
+    return result, report.getvalue()
+
+
+# The metrics shared by the whole app; enabled by the Debug tab, --metrics or DJMAX_METRICS=1
+METRICS = Metrics()
+if os.environ.get("DJMAX_METRICS") == "1":
+    METRICS.enable()
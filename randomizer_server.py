@@ -0,0 +1,396 @@
+"""
+Local HTTP draw service for stream overlays and chat bots.
+
+Serves draws from a resident song index on 127.0.0.1 using asyncio:
+
+    GET /draw?categories=RP,VE&key_mode=6B&nm_hd_mx_level=8-12&sc=0&count=1
+        Draws charts and returns them as JSON. Query parameters mirror the GUI filters:
+        categories (comma separated, default All), key_mode (All/4B/5B/6B/8B, or several comma
+        separated), nm_hd_mx and sc (1/0 to include or exclude), nm_hd_mx_level and sc_level (MIN-MAX),
+        difficulties (individual difficulties with their own levels, e.g. NM=1-5,MX=10-13,SC; replaces
+        nm_hd_mx, sc and their levels), count, unique_songs (1/0),
+        fairness (chart/song/category/custom), weights (e.g. RP=2,VE=0.5), seed, user (shown on
+        the overlay) and save (1/0, default 1: record the draw in the history).
+    GET /overlay
+        A page for an OBS browser source that shows every draw live.
+    GET /events
+        The server-sent event stream behind the overlay; one "draw" event per request to /draw.
+    GET /status, GET /metrics
+        Server counters (including the filter cache hit rate), and the per-stage timings when
+        started with --metrics.
+
+History writes are queued and written in batches on a background thread, so bursts of requests
+never wait for the disk.
+
+Example:
+    python randomizer_server.py --port 8765 --no-repeat-draws 20
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Set, Tuple
+from urllib.parse import urlsplit, parse_qs
+from randomizer_core import (SONG_LIST_FILE, CATEGORY_NAMES_FILE, KEY_MODES, FAIRNESS_MODES, FILTER_CACHE_SIZE,
+                             ChartFilter, Fairness, ChartIndex, parse_category_weights, parse_difficulty_levels,
+                             format_stars, REPEAT_ATTEMPTS, DIFFICULTY_COLORS)
+from randomizer_cache import load_song_database
+from randomizer_history import HISTORY_DB_FILE, HistoryStore, load_recent_draws
+from randomizer_metrics import METRICS
+
+HOST = "127.0.0.1"  # Only reachable from this machine
+DEFAULT_PORT = 8765
+MAX_COUNT = 100  # Most charts one request may draw
+HISTORY_BATCH_SECONDS = 0.25  # How long queued history writes may wait to be batched together
+HISTORY_QUEUE_SIZE = 10000
+SSE_HEARTBEAT_SECONDS = 15
+SSE_QUEUE_SIZE = 100  # Events buffered per overlay client; a stalled client loses the oldest ones
+
+OVERLAY_PAGE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>DJMAX RESPECT RANDOMIZER</title>
+<style>
+  body { margin: 0; background: transparent; color: white; font-family: Helvetica, sans-serif; text-align: center; }
+  #draw { display: inline-block; padding: 16px 32px; background: rgba(0, 0, 0, 0.8); border: 1px solid white; }
+  #category { font-size: 20px; color: #cccccc; }
+  #title { font-size: 36px; font-weight: bold; }
+  #stars { font-size: 28px; }
+  #user { font-size: 16px; color: #999999; }
+</style>
+</head>
+<body>
+<div id="draw"><div id="category"></div><div id="title">Waiting for a draw...</div><div id="stars"></div><div id="user"></div></div>
+<script>
+  const colors = %s;
+  const events = new EventSource("/events");
+  events.addEventListener("draw", (event) => {
+    const data = JSON.parse(event.data);
+    const chart = data.draws[data.draws.length - 1];
+    document.getElementById("category").textContent = chart.category_name;
+    document.getElementById("title").textContent = chart.title + " (" + chart.difficulty + ")";
+    const stars = document.getElementById("stars");
+    stars.textContent = chart.stars;
+    stars.style.color = colors[chart.difficulty.split(" ").pop()] || "white";
+    document.getElementById("user").textContent = data.user ? "for " + data.user : "";
+  });
+</script>
+</body>
+</html>
+"""
+class BadRequest(Exception):
+    """A query parameter could not be understood; answered with HTTP 400."""
+
+
+def _query_bool(query: Dict[str, List[str]], name: str, default: bool) -> bool:
+    value = query.get(name, [None])[-1]
+    if value is None:
+        return default
+    if value.lower() in ("1", "true", "yes", "on"):
+        return True
+    if value.lower() in ("0", "false", "no", "off"):
+        return False
+    raise BadRequest(f"'{name}' must be 1 or 0")
+
+
+def _query_int(query: Dict[str, List[str]], name: str, default: Optional[int]) -> Optional[int]:
+    value = query.get(name, [None])[-1]
+    if value is None:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise BadRequest(f"'{name}' must be a whole number") from None
+
+
+def _query_level_range(query: Dict[str, List[str]], name: str) -> Tuple[int, int]:
+    value = query.get(name, ["1-15"])[-1]
+    low, separator, high = value.partition("-")
+    try:
+        return (int(low), int(high)) if separator else (int(low), int(low))
+    except ValueError:
+        raise BadRequest(f"'{name}' must be a level or a MIN-MAX level range") from None
+
+
+def parse_draw_query(query: Dict[str, List[str]]) -> Tuple[ChartFilter, Fairness, int, bool]:
+    """
+    Converts /draw query parameters into draw settings.
+
+    Args:
+        query (Dict[str, List[str]]): The parsed query string.
+
+    Returns:
+        Tuple[ChartFilter, Fairness, int, bool]: The filter, the fairness, the chart count and
+            whether songs must be unique.
+
+    Raises:
+        BadRequest: If a parameter is invalid.
+    """
+    categories = tuple(category for value in query.get("categories", ["All"])
+                       for category in value.split(",") if category) or ("All",)
+    key_mode = query.get("key_mode", ["All"])[-1]
+    if not key_mode or any(name not in ["All"] + KEY_MODES for name in key_mode.split(",")):
+        raise BadRequest(f"'key_mode' must be one or more of {', '.join(['All'] + KEY_MODES)}, comma separated")
+    try:
+        difficulty_levels = parse_difficulty_levels(query.get("difficulties", [""])[-1])
+    except ValueError as e:
+        raise BadRequest(str(e)) from None
+    nm_hd_mx_min, nm_hd_mx_max = _query_level_range(query, "nm_hd_mx_level")
+    sc_min, sc_max = _query_level_range(query, "sc_level")
+    chart_filter = ChartFilter(categories, key_mode, _query_bool(query, "nm_hd_mx", True), _query_bool(query, "sc", True),
+                               nm_hd_mx_min, nm_hd_mx_max, sc_min, sc_max, difficulty_levels)
+
+    mode = query.get("fairness", ["chart"])[-1]
+    if mode not in FAIRNESS_MODES:
+        raise BadRequest(f"'fairness' must be one of {', '.join(FAIRNESS_MODES)}")
+    try:
+        fairness = Fairness(mode, parse_category_weights(query.get("weights", [""])[-1]))
+    except ValueError as e:
+        raise BadRequest(str(e)) from None
+
+    count = _query_int(query, "count", 1)
+    if not 1 <= count <= MAX_COUNT:
+        raise BadRequest(f"'count' must be between 1 and {MAX_COUNT}")
+    return chart_filter, fairness, count, _query_bool(query, "unique_songs", False)
+
+
+class DrawServer:
+    """
+    The draw service: the resident song index, the no-repeat window, the overlay subscribers and
+    the batched history writer.
+    """
+
+    def __init__(self, index: ChartIndex, full_category_names: Dict[str, Dict[str, str]],
+                 history_file=HISTORY_DB_FILE, no_repeat_draws: int = 0, no_repeat_minutes: float = 0):
+        self.index = index
+        self.full_category_names = full_category_names
+        self.history_file = history_file
+        self.rng = random.Random()
+        self.subscribers: Set[asyncio.Queue] = set()
+        self.history_queue: Optional[asyncio.Queue] = None
+        # SQLite connections belong to one thread, so every history access goes through this worker
+        self.history_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history")
+        self.history_store: Optional[HistoryStore] = None
+        self.recent = self.history_executor.submit(self._load_recent, no_repeat_draws, no_repeat_minutes * 60).result()
+        self.draw_count = 0
+
+    def _open_history(self) -> HistoryStore:
+        if self.history_store is None:
+            self.history_store = HistoryStore(self.history_file)
+        return self.history_store
+
+    def _load_recent(self, max_draws: int, max_age: float):
+        return load_recent_draws(self._open_history(), max_draws, max_age)
+
+    def _write_history(self, songs: List[Tuple[str, str, str, str]]):
+        with METRICS.stage("history"):
+            self._open_history().append_many(songs)
+
+    async def history_writer(self):
+        """
+        Writes queued history entries in batches, one transaction per batch. Stops after writing
+        everything queued before a None; see flush_history.
+        """
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            batch = [await self.history_queue.get()]
+            if batch[0] is not None:
+                await asyncio.sleep(HISTORY_BATCH_SECONDS)  # Let a burst of draws pile up
+            while not self.history_queue.empty():
+                batch.append(self.history_queue.get_nowait())
+            stopping = None in batch
+            batch = [song_data for song_data in batch if song_data is not None]
+            if not batch:
+                continue
+            try:
+                await loop.run_in_executor(self.history_executor, self._write_history, batch)
+            except Exception as e:
+                print(f"An error occurred while saving to history: {e}", file=sys.stderr)
+
+    async def flush_history(self, writer_task: asyncio.Task):
+        """Lets the history writer write whatever is still queued (including a batch it holds) and stop."""
+        await self.history_queue.put(None)
+        await writer_task
+
+    def draw(self, query: Dict[str, List[str]]) -> dict:
+        """
+        Handles a /draw request.
+
+        Raises:
+            BadRequest: If a parameter is invalid.
+        """
+        chart_filter, fairness, count, unique_songs = parse_draw_query(query)
+        seed = _query_int(query, "seed", None)
+        rng = self.rng if seed is None else random.Random(seed)
+        with METRICS.stage("draw"):
+            if self.recent.enabled:
+                charts = self._draw_without_repeats(chart_filter, count, rng, unique_songs, fairness)
+            else:
+                charts = self.index.draw_many(chart_filter, count, rng, unique_songs, fairness)
+
+        songs = [self.index.chart_tuple(chart) for chart in charts]
+        if songs and _query_bool(query, "save", True):
+            for song_data in songs:
+                try:
+                    self.history_queue.put_nowait(song_data)
+                except asyncio.QueueFull:
+                    print("History queue is full; a draw was not saved.", file=sys.stderr)
+        self.draw_count += len(songs)
+        result = {
+            "draws": [{"title": title, "difficulty": difficulty, "level": int(level), "category": category,
+                       "category_name": self.full_category_names.get(category, {'full_name': category})['full_name'],
+                       "stars": format_stars(difficulty, level)}
+                      for title, difficulty, level, category in songs],
+            "user": query.get("user", [""])[-1],
+        }
+        if songs:
+            event = f"event: draw\ndata: {json.dumps(result, ensure_ascii=False)}\n\n".encode("utf-8")
+            for subscriber in self.subscribers:
+                if subscriber.full():
+                    subscriber.get_nowait()  # The client is not reading; drop its oldest event
+                subscriber.put_nowait(event)
+        return result
+
+    def _draw_without_repeats(self, chart_filter, count: int, rng, unique_songs: bool, fairness) -> List[int]:
+        """
+        Draws chart by chart through the no-repeat window, adding each chart to it as it is drawn.
+        With unique_songs, a pick of a song already drawn is redrawn; the draw stops short if
+        REPEAT_ATTEMPTS picks in a row hit such songs.
+        """
+        charts, songs = [], set()
+        for _ in range(count):
+            for _ in range(REPEAT_ATTEMPTS):
+                chart = self.index.draw(chart_filter, rng, self.recent, fairness)
+                if chart is None or not unique_songs or self.index.chart_song[chart] not in songs:
+                    break
+            else:
+                break
+            if chart is None:
+                break
+            charts.append(chart)
+            songs.add(self.index.chart_song[chart])
+            self.recent.add(self.index.chart_tuple(chart))
+        return charts
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Serves one HTTP request per connection."""
+        try:
+            request_line = await reader.readline()
+            while (await reader.readline()).strip():  # Skip the headers
+                pass
+            parts = request_line.decode("latin-1").split()
+            if len(parts) < 2 or parts[0] != "GET":
+                await self._respond(writer, 405, {"error": "Only GET is supported"})
+                return
+            url = urlsplit(parts[1])
+            query = parse_qs(url.query)
+            if url.path == "/draw":
+                try:
+                    result = self.draw(query)
+                except BadRequest as e:
+                    await self._respond(writer, 400, {"error": str(e)})
+                    return
+                await self._respond(writer, 200 if result["draws"] else 404,
+                                    result if result["draws"] else {"error": "No songs found with the selected criteria."})
+            elif url.path == "/overlay":
+                await self._respond(writer, 200, OVERLAY_PAGE % json.dumps(DIFFICULTY_COLORS), "text/html; charset=utf-8")
+            elif url.path == "/events":
+                await self._stream_events(writer)
+            elif url.path == "/status":
+                await self._respond(writer, 200, {"charts": len(self.index), "draws": self.draw_count,
+                                                  "overlay_clients": len(self.subscribers),
+                                                  "history_queue": self.history_queue.qsize(),
+                                                  "filter_cache": self.index.filter_cache.stats()})
+            elif url.path == "/metrics":
+                await self._respond(writer, 200, {"enabled": METRICS.enabled, "stages": METRICS.summary()})
+            else:
+                await self._respond(writer, 404, {"error": "Not found"})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, writer: asyncio.StreamWriter, status: int, body, content_type="application/json"):
+        if not isinstance(body, str):
+            body = json.dumps(body, ensure_ascii=False)
+        payload = body.encode("utf-8")
+        reason = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed"}[status]
+        writer.write(f"HTTP/1.1 {status} {reason}\r\nContent-Type: {content_type}\r\n"
+                     f"Content-Length: {len(payload)}\r\nAccess-Control-Allow-Origin: *\r\n"
+                     f"Connection: close\r\n\r\n".encode("latin-1") + payload)
+        await writer.drain()
+
+    async def _stream_events(self, writer: asyncio.StreamWriter):
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n"
+                     b"Access-Control-Allow-Origin: *\r\nConnection: keep-alive\r\n\r\n")
+        await writer.drain()
+        events: asyncio.Queue = asyncio.Queue(SSE_QUEUE_SIZE)
+        self.subscribers.add(events)
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(events.get(), SSE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    event = b": heartbeat\n\n"  # Keeps proxies and OBS from dropping an idle stream
+                writer.write(event)
+                await writer.drain()
+        finally:
+            self.subscribers.discard(events)
+
+    async def serve(self, port: int = DEFAULT_PORT):
+        """Runs the server until cancelled, then flushes the pending history writes."""
+        self.history_queue = asyncio.Queue(HISTORY_QUEUE_SIZE)
+        writer_task = asyncio.create_task(self.history_writer())
+        server = await asyncio.start_server(self.handle_connection, HOST, port)
+        print(f"Serving {len(self.index)} charts on http://{HOST}:{port} "
+              f"(overlay: http://{HOST}:{port}/overlay)", file=sys.stderr)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await self.flush_history(writer_task)
+            self.history_executor.submit(lambda: self.history_store and self.history_store.close()).result()
+            self.history_executor.shutdown()
+
+
+def main(argv=None) -> int:
+    started = time.perf_counter()
+    parser = argparse.ArgumentParser(description="Serve random DJMAX RESPECT V charts over HTTP on localhost.")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"Port to listen on. Default: {DEFAULT_PORT}.")
+    parser.add_argument("--songs", default=SONG_LIST_FILE, help="Path to the song list CSV.")
+    parser.add_argument("--category-names", default=CATEGORY_NAMES_FILE, help="Path to the category names CSV.")
+    parser.add_argument("--no-repeat-draws", type=int, default=0, metavar="N",
+                        help="Skip charts drawn in the last N draws.")
+    parser.add_argument("--no-repeat-minutes", type=float, default=0, metavar="T",
+                        help="Skip charts drawn in the last T minutes.")
+    parser.add_argument("--metrics", action="store_true", help="Record per-stage timings, served at /metrics.")
+    parser.add_argument("--filter-cache-size", type=int, default=FILTER_CACHE_SIZE, metavar="N",
+                        help=f"Number of recent filters whose results are kept (hit rate at /status). "
+                             f"Default: {FILTER_CACHE_SIZE}.")
+    args = parser.parse_args(argv)
+    if args.metrics:
+        METRICS.enable()
+
+    try:
+        song_database = load_song_database(args.songs, args.category_names)
+    except FileNotFoundError:
+        print(f"Error: CSV file '{args.songs}' not found.", file=sys.stderr)
+        return 2
+    song_database.index.filter_cache.capacity = args.filter_cache_size
+    server = DrawServer(song_database.index, song_database.full_category_names,
+                        no_repeat_draws=args.no_repeat_draws, no_repeat_minutes=args.no_repeat_minutes)
+    print(f"Startup: {(time.perf_counter() - started) * 1000:.0f} ms", file=sys.stderr)
+    try:
+        asyncio.run(server.serve(args.port))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,273 @@
+"""
+Statistics over the draw history, computed in one streaming pass and checkpointed.
+
+The aggregates (draws per chart, per level, first and last draw time) and the id of the last
+processed history entry are saved next to the history database (history_stats.json for history.db).
+Each update only reads the entries added since the checkpoint, oldest first, in pages; draws per
+category, key mode, difficulty and song and the coverage of a song pool are all derived from the
+per-chart counts. History ids are never reused, so the id plays the role of a file offset.
+
+Example:
+    python randomizer_stats.py --categories RP VE P1 P2 --top 15
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+from randomizer_core import SONG_LIST_FILE, CATEGORY_NAMES_FILE, ChartFilter, ChartIndex, chart_key
+from randomizer_history import HISTORY_DB_FILE, HistoryStore
+
+STATS_VERSION = 1
+STATS_PAGE_SIZE = 10000  # History entries read per query while folding in new draws
+
+
+class HistoryStats:
+    """
+    Aggregates of the draw history up to (and including) entry last_id.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """Forgets every aggregate."""
+        self.first_id = 0  # Oldest entry folded in; if it leaves the history, the history was cleared
+        self.last_id = 0
+        self.total = 0
+        self.first_drawn_at: Optional[float] = None
+        self.last_drawn_at: Optional[float] = None
+        self.chart_counts: Dict[Tuple[str, str, str], int] = {}  # (title, difficulty, category) -> draws
+        self.level_counts: Dict[Tuple[str, int], int] = {}  # (difficulty, e.g. "SC", level) -> draws
+
+    @classmethod
+    def load(cls, stats_file) -> 'HistoryStats':
+        """
+        Loads a checkpoint. A missing, unreadable or outdated file gives empty statistics.
+
+        Args:
+            stats_file (str): The path to the checkpoint.
+        """
+        stats = cls()
+        try:
+            with open(stats_file, "r", encoding="utf-8") as file:
+                data = json.load(file)
+            if data.get("version") != STATS_VERSION:
+                return stats
+            stats.first_id, stats.last_id, stats.total = data["first_id"], data["last_id"], data["total"]
+            stats.first_drawn_at, stats.last_drawn_at = data["first_drawn_at"], data["last_drawn_at"]
+            stats.chart_counts = {(title, difficulty, category): count
+                                  for title, difficulty, category, count in data["charts"]}
+            stats.level_counts = {(difficulty, level): count for difficulty, level, count in data["levels"]}
+        except FileNotFoundError:
+            pass
+        except (ValueError, KeyError, TypeError) as e:
+            print(f"Ignoring the unreadable statistics checkpoint '{stats_file}': {e}")
+            return cls()
+        return stats
+
+    def save(self, stats_file):
+        """Writes the checkpoint; the file is replaced atomically."""
+        data = {
+            "version": STATS_VERSION,
+            "first_id": self.first_id, "last_id": self.last_id, "total": self.total,
+            "first_drawn_at": self.first_drawn_at, "last_drawn_at": self.last_drawn_at,
+            "charts": [[title, difficulty, category, count]
+                       for (title, difficulty, category), count in self.chart_counts.items()],
+            "levels": [[difficulty, level, count] for (difficulty, level), count in self.level_counts.items()],
+        }
+        temp_file = stats_file + ".tmp"
+        with open(temp_file, "w", encoding="utf-8") as file:
+            json.dump(data, file, ensure_ascii=False)
+        os.replace(temp_file, stats_file)
+
+    def update(self, history_store: HistoryStore) -> int:
+        """
+        Folds in the entries added to the history since the last update. Starts over if the
+        history was cleared in the meantime.
+
+        Args:
+            history_store (HistoryStore): The draw history.
+
+        Returns:
+            int: The number of entries folded in.
+        """
+        oldest_id, newest_id = history_store.id_range()
+        if self.total and (newest_id < self.last_id or oldest_id > self.first_id):
+            self.reset()  # The history was cleared since the checkpoint
+        folded = 0
+        while True:
+            entries = history_store.after(self.last_id, STATS_PAGE_SIZE)
+            for entry in entries:
+                self.add(entry)
+            folded += len(entries)
+            if len(entries) < STATS_PAGE_SIZE:
+                return folded
+
+    def add(self, entry):
+        """Folds in one history entry."""
+        if not self.total:
+            self.first_id, self.first_drawn_at = entry.entry_id, entry.drawn_at
+        self.last_id, self.last_drawn_at = entry.entry_id, entry.drawn_at
+        self.total += 1
+        key = chart_key(entry)
+        self.chart_counts[key] = self.chart_counts.get(key, 0) + 1
+        level_key = (entry.difficulty.split()[-1], int(entry.level) if entry.level.isdigit() else 0)
+        self.level_counts[level_key] = self.level_counts.get(level_key, 0) + 1
+
+    def _counts_by(self, part) -> Dict[str, int]:
+        counts = {}
+        for key, count in self.chart_counts.items():
+            counts[part(key)] = counts.get(part(key), 0) + count
+        return dict(sorted(counts.items(), key=lambda item: (-item[1], item[0])))
+
+    def by_category(self) -> Dict[str, int]:
+        """Returns the draws per short category name, most drawn first."""
+        return self._counts_by(lambda key: key[2])
+
+    def by_key_mode(self) -> Dict[str, int]:
+        """Returns the draws per key mode, most drawn first."""
+        return self._counts_by(lambda key: key[1].split()[0])
+
+    def by_difficulty(self) -> Dict[str, int]:
+        """Returns the draws per difficulty (NM, HD, MX, SC), most drawn first."""
+        return self._counts_by(lambda key: key[1].split()[-1])
+
+    def by_level(self) -> Dict[str, int]:
+        """Returns the draws per difficulty group and level, e.g. "NM/HD/MX 12" or "SC 8", in level order."""
+        counts = {}
+        for (difficulty, level), count in sorted(self.level_counts.items(), key=lambda item: (item[0][0] == "SC",
+                                                                                             item[0][1])):
+            group = "SC" if difficulty == "SC" else "NM/HD/MX"
+            counts[f"{group} {level}"] = counts.get(f"{group} {level}", 0) + count
+        return counts
+
+    def top_songs(self, limit: int = 10) -> List[Tuple[str, str, int]]:
+        """Returns the most drawn songs as (title, category, draws)."""
+        counts = self._counts_by(lambda key: (key[0], key[2]))
+        return [(title, category, count) for (title, category), count in list(counts.items())[:limit]]
+
+    def coverage(self, index: ChartIndex, pool: ChartFilter) -> Dict[str, float]:
+        """
+        Measures how much of a song pool has been drawn at least once.
+
+        Args:
+            index (ChartIndex): The song list.
+            pool (ChartFilter): The pool, e.g. every chart of the owned categories.
+
+        Returns:
+            Dict[str, float]: Drawn and total charts and songs, and the percentages.
+        """
+        charts = index.filter(pool)
+        drawn_charts = [chart for chart in charts if index.chart_key(chart) in self.chart_counts]
+        songs = {index.chart_song[chart] for chart in charts}
+        drawn_songs = {index.chart_song[chart] for chart in drawn_charts}
+        return {"charts": len(charts), "drawn_charts": len(drawn_charts),
+                "chart_percent": 100 * len(drawn_charts) / len(charts) if charts else 0.0,
+                "songs": len(songs), "drawn_songs": len(drawn_songs),
+                "song_percent": 100 * len(drawn_songs) / len(songs) if songs else 0.0}
+
+    def report(self, index: Optional[ChartIndex] = None, pool: Optional[ChartFilter] = None,
+               full_category_names: Optional[Dict[str, Dict[str, str]]] = None, top: int = 10) -> str:
+        """
+        Formats the statistics as text, as shown in the Stats tab and printed by the command line.
+
+        Args:
+            index (Optional[ChartIndex]): The song list, for the coverage.
+            pool (Optional[ChartFilter]): The pool to measure the coverage of.
+            full_category_names (Optional[Dict[str, Dict[str, str]]]): For full category names.
+            top (int): The number of most drawn songs listed.
+        """
+        if not self.total:
+            return "No draws yet."
+        full_category_names = full_category_names or {}
+        lines = [f"{self.total} draws from {time.strftime('%Y-%m-%d %H:%M', time.localtime(self.first_drawn_at))} "
+                 f"to {time.strftime('%Y-%m-%d %H:%M', time.localtime(self.last_drawn_at))}"]
+        if index is not None and pool is not None:
+            coverage = self.coverage(index, pool)
+            lines.append(f"Coverage: {coverage['drawn_songs']}/{coverage['songs']} songs "
+                         f"({coverage['song_percent']:.1f}%), {coverage['drawn_charts']}/{coverage['charts']} "
+                         f"charts ({coverage['chart_percent']:.1f}%)")
+        lines += ["", "Most drawn songs:"]
+        lines += [f"  {count:>6}  [{category}] {title}" for title, category, count in self.top_songs(top)]
+        for heading, counts in (("Key modes", self.by_key_mode()), ("Difficulties", self.by_difficulty()),
+                                ("Levels", self.by_level())):
+            lines += ["", f"{heading}:"] + [f"  {count:>6}  {name}" for name, count in counts.items()]
+        lines += ["", "Categories:"]
+        lines += [f"  {count:>6}  {full_category_names.get(category, {'full_name': category})['full_name']}"
+                  for category, count in self.by_category().items()]
+        return "\n".join(lines)
+
+
+def default_stats_file(db_file) -> str:
+    """Returns the checkpoint path used for a history database, e.g. "history_stats.json" next to "history.db"."""
+    return os.path.splitext(db_file)[0] + "_stats.json"
+
+
+def load_history_stats(history_store: HistoryStore, stats_file: Optional[str] = None,
+                       stats: Optional[HistoryStats] = None) -> HistoryStats:
+    """
+    Folds the new history entries into the statistics and saves the checkpoint if anything changed.
+
+    Args:
+        history_store (HistoryStore): The draw history.
+        stats_file (Optional[str]): The checkpoint; defaults to default_stats_file(history_store.db_file).
+        stats (Optional[HistoryStats]): Statistics already in memory; loaded from the checkpoint if None.
+
+    Returns:
+        HistoryStats: The up to date statistics.
+    """
+    if stats_file is None:
+        stats_file = default_stats_file(history_store.db_file)
+    if stats is None:
+        stats = HistoryStats.load(stats_file)
+    previous = (stats.first_id, stats.last_id)
+    stats.update(history_store)
+    if (stats.first_id, stats.last_id) != previous:
+        try:
+            stats.save(stats_file)
+        except OSError as e:
+            print(f"Could not save the statistics checkpoint '{stats_file}': {e}")
+    return stats
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Report statistics about the draw history.")
+    parser.add_argument("--songs", default=SONG_LIST_FILE, help="Path to the song list CSV.")
+    parser.add_argument("--category-names", default=CATEGORY_NAMES_FILE, help="Path to the category names CSV.")
+    parser.add_argument("--history", default=HISTORY_DB_FILE, help="Path to the history database.")
+    parser.add_argument("--categories", nargs="+", default=["All"], metavar="CATEGORY",
+                        help="The categories you own, for the coverage. Default: All.")
+    parser.add_argument("--top", type=int, default=10, help="Number of most drawn songs to list. Default: 10.")
+    parser.add_argument("--json", action="store_true", help="Print the statistics as JSON.")
+    args = parser.parse_args(argv)
+
+    from randomizer_cache import load_song_database
+    history_store = HistoryStore(args.history)
+    stats = load_history_stats(history_store)
+    history_store.close()
+    pool = ChartFilter(tuple(args.categories), "All", True, True, 1, 15, 1, 15)
+    try:
+        song_database = load_song_database(args.songs, args.category_names)
+        index, full_category_names = song_database.index, song_database.full_category_names
+    except FileNotFoundError:
+        print(f"Error: CSV file '{args.songs}' not found; the coverage is left out.", file=sys.stderr)
+        index, full_category_names = None, {}
+
+    if args.json:
+        print(json.dumps({
+            "draws": stats.total, "first_drawn_at": stats.first_drawn_at, "last_drawn_at": stats.last_drawn_at,
+            "coverage": stats.coverage(index, pool) if index else None,
+            "top_songs": [{"title": title, "category": category, "draws": count}
+                          for title, category, count in stats.top_songs(args.top)],
+            "categories": stats.by_category(), "key_modes": stats.by_key_mode(),
+            "difficulties": stats.by_difficulty(), "levels": stats.by_level(),
+        }, ensure_ascii=False, indent=2))
+    else:
+        print(stats.report(index, pool, full_category_names, args.top))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())